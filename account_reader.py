@@ -1,15 +1,40 @@
+import hashlib
+import io
+import json
+import threading
+import time
+import zipfile
+import numpy as np
 import pandas as pd
-from os import listdir
+import pyarrow as pa
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from os import PathLike, listdir, makedirs, replace, stat
 from os.path import isfile, join
 
+account_names = ["Fixed", "Variable", "Offset"]
 
-def read_statement_from_file(df: pd.DataFrame, file, account_name) -> pd.DataFrame:
-    df_in = pd.read_csv(file)
+
+def _parse_statement(file, account_name, source=None) -> pd.DataFrame:
+    # note: source is a file-like object to parse instead of file, which is still the File column
+
+    df_in = pd.read_csv(file if source is None else source)
 
     df_in["File"] = file
     df_in["AccountName"] = account_name
     df_in["DateSeries"] = pd.to_datetime(df_in["Date"], dayfirst=True)
 
+    return df_in
+
+
+def read_statement_from_file(df: pd.DataFrame, file, account_name) -> pd.DataFrame:
+    # note: concatenating statements one by one copies df every time,
+    #       thus the readers below collect the statements first (see read_account_from_folder)
+
+    df_in = _parse_statement(file, account_name)
+
     if df is None:
         df = df_in
     else:
@@ -18,23 +43,333 @@ def read_statement_from_file(df: pd.DataFrame, file, account_name) -> pd.DataFra
     return df
 
 
-def read_account_from_folder(
-    path_loans, account_name, df: pd.DataFrame
-) -> pd.DataFrame:
+# arrow
+# note: parsed rows are cached as Arrow IPC files (the manifest and the partitions below),
+#       with the pandas dtype of each column, as Arrow alone does not restore e.g.
+#       the object columns of a statement without rows
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    dtypes = {column: str(dtype) for column, dtype in df.dtypes.items()}
+    return table.replace_schema_metadata(
+        {**table.schema.metadata, b"dtypes": json.dumps(dtypes).encode()}
+    )
+
+
+def _to_frame(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    # note: df as converted from a table, dtypes as kept by _to_table,
+    #       only the columns which Arrow did not restore are cast
+
+    df = df[list(dtypes)]
+    dtypes = {
+        column: dtype
+        for column, dtype in dtypes.items()
+        if str(df[column].dtype) != dtype
+    }
+    return df.astype(dtypes) if len(dtypes) > 0 else df
+
+
+# manifest
+# note: the manifest keeps the parsed rows of each statement, together with its size, mtime
+#       and content hash, thus on the next load only new or changed statements are parsed,
+#       a statement whose size or mtime changed is hashed, and only parsed if its content changed,
+#       it is a single Arrow IPC file, with the rows of all statements one after the other,
+#       and the path, size, mtime, hash, row count and dtypes of each statement as JSON metadata
+
+manifest_file = ".account_manifest.arrow"
+manifest_version = 2
+
+
+@dataclass
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    rows: pd.DataFrame
+
+
+def load_manifest(data_folder) -> dict:
+    # note: a missing, unreadable or outdated manifest is the same as an empty one,
+    #       as is one with malformed metadata (hence the key, type and attribute errors)
+
+    try:
+        with pa.memory_map(join(data_folder, manifest_file)) as source:
+            reader = pa.ipc.open_file(source)
+            metadata = json.loads((reader.schema.metadata or {})[b"manifest"])
+            if metadata["version"] != manifest_version:
+                return {}
+            df = reader.read_all().to_pandas()
+
+        manifest = {}
+        start = 0
+        for file, entry in metadata["files"].items():
+            stop = start + entry["rows"]
+            rows = _to_frame(df.iloc[start:stop], entry["dtypes"])
+            rows.reset_index(inplace=True, drop=True)
+            manifest[file] = ManifestEntry(
+                entry["size"], entry["mtime_ns"], entry["sha256"], rows
+            )
+            start = stop
+    except (
+        OSError,
+        pa.ArrowException,
+        ValueError,
+        KeyError,
+        TypeError,
+        AttributeError,
+    ):
+        return {}
+
+    return manifest
+
+
+def save_manifest(data_folder, manifest: dict):
+    # note: the manifest is only a cache, thus e.g. rows that cannot be represented in Arrow,
+    #       or a read-only data folder, are not an error
+
+    try:
+        files = {}
+        tables = []
+        for file, entry in manifest.items():
+            table = _to_table(entry.rows)
+            files[file] = {
+                "size": entry.size,
+                "mtime_ns": entry.mtime_ns,
+                "sha256": entry.sha256,
+                "rows": len(entry.rows),
+                "dtypes": json.loads(table.schema.metadata[b"dtypes"]),
+            }
+            tables.append(table)
+
+        # note: statements with other columns or types are unified, their dtypes are restored on load
+        table = (
+            pa.concat_tables(tables, promote_options="permissive")
+            if len(tables) > 0
+            else pa.table({})
+        )
+        metadata = {"version": manifest_version, "files": files}
+        table = table.replace_schema_metadata(
+            {b"manifest": json.dumps(metadata).encode()}
+        )
+
+        path = join(data_folder, manifest_file)
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        replace(path + ".tmp", path)
+    except (OSError, pa.ArrowException):
+        pass
+
+
+def read_statement_with_manifest(file, account_name, manifest: dict) -> pd.DataFrame:
+    # note: updates the manifest entry of file, returns a copy of its rows
+
+    file_stat = stat(file)
+    entry = manifest.get(file)
+
+    if (
+        entry is None
+        or entry.size != file_stat.st_size
+        or entry.mtime_ns != file_stat.st_mtime_ns
+    ):
+        with open(file, "rb") as f:
+            content = f.read()
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        if entry is None or entry.sha256 != sha256:
+            rows = _parse_statement(file, account_name, io.BytesIO(content))
+        else:
+            rows = entry.rows
+
+        entry = ManifestEntry(len(content), file_stat.st_mtime_ns, sha256, rows)
+        manifest[file] = entry
+
+    return entry.rows.copy()
+
+
+def get_statement_files(path_loans, account_name) -> list:
     path_account = join(path_loans, account_name)
-    csvs_account = [
+    return [
         join(path_account, f)
         for f in listdir(path_account)
         if isfile(join(path_account, f)) and ".csv" in f
     ]
 
-    for csv in csvs_account:
-        df = read_statement_from_file(df, csv, account_name)
 
-    return df
+def read_statement(
+    file, account_name, manifest: dict | None = None, timings=None
+) -> pd.DataFrame:
+    # note: with a manifest, unchanged statements are taken from it (see read_statement_with_manifest),
+    #       with timings (a list), (file, seconds) is appended to it
+
+    start = time.perf_counter()
+
+    if manifest is None:
+        df_in = _parse_statement(file, account_name)
+    else:
+        df_in = read_statement_with_manifest(file, account_name, manifest)
+
+    if timings is not None:
+        timings.append((file, time.perf_counter() - start))
+
+    return df_in
+
+
+def iter_statements(
+    path_loans, account_name, manifest: dict | None = None, executor=None, timings=None
+):
+    # note: with an executor, all statements are submitted right away,
+    #       and the iterator yields them in order as they are done
+
+    files = get_statement_files(path_loans, account_name)
+
+    def read(file):
+        return read_statement(file, account_name, manifest, timings)
+
+    if executor is None:
+        return map(read, files)
+    return executor.map(read, files)
+
+
+def read_account_from_folder(
+    path_loans,
+    account_name,
+    df: pd.DataFrame,
+    manifest: dict | None = None,
+    executor=None,
+    timings=None,
+) -> pd.DataFrame:
+    # note: the statements are collected first, and concatenated once
+
+    frames = [] if df is None else [df]
+    frames.extend(
+        iter_statements(path_loans, account_name, manifest, executor, timings)
+    )
+
+    return pd.concat(frames, ignore_index=True) if len(frames) > 0 else None
+
+
+# partitions
+# note: the parsed rows of each account are also kept as an Arrow IPC file (a partition),
+#       stamped with the path, size and mtime of the statements they were parsed from,
+#       when the statements of an account are unchanged, its partition is read through memory mapping,
+#       without loading the manifest, otherwise the partition is rebuilt through the manifest
+
+partition_folder = ".account_partitions"
+
+
+def get_statement_sources(path_loans, account_name) -> list:
+    sources = []
+    for file in get_statement_files(path_loans, account_name):
+        file_stat = stat(file)
+        sources.append([file, file_stat.st_size, file_stat.st_mtime_ns])
+    return sources
+
+
+def get_partition_file(data_folder, account_name):
+    return join(data_folder, partition_folder, account_name + ".arrow")
+
+
+def read_partition(data_folder, account_name, sources: list) -> pd.DataFrame | None:
+    # note: None if there is no partition, or if it was parsed from other sources
+    #       (or without dtypes, by an older version)
+
+    try:
+        with pa.memory_map(get_partition_file(data_folder, account_name)) as source:
+            reader = pa.ipc.open_file(source)
+            metadata = reader.schema.metadata or {}
+            dtypes = json.loads(metadata.get(b"dtypes", b"null"))
+            if json.loads(metadata.get(b"sources", b"null")) != sources or not dtypes:
+                return None
+            return _to_frame(reader.read_all().to_pandas(), dtypes)
+    except (OSError, pa.ArrowException, ValueError):
+        return None
+
+
+def write_partition(data_folder, account_name, df: pd.DataFrame, sources: list):
+    # note: the partition is only a cache, thus e.g. rows that cannot be represented in Arrow,
+    #       or a read-only data folder, are not an error
+
+    try:
+        table = _to_table(df)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, b"sources": json.dumps(sources).encode()}
+        )
+
+        path = get_partition_file(data_folder, account_name)
+        makedirs(join(data_folder, partition_folder), exist_ok=True)
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        replace(path + ".tmp", path)
+    except (OSError, pa.ArrowException):
+        pass
+
+
+# labels
+# note: the label of a transaction is the label of the first rule it matches, default_label otherwise,
+#       a rule matches transactions of its account (any account if None), in its direction
+#       ("debit" for Debit < 0, "credit" for Credit > 0, either if None), with its description
+#       (a substring of Description, or a regular expression with regex, any description if None),
+#       thus e.g. another bank's description patterns are added as rules before the default ones
+
+
+@dataclass(frozen=True)
+class LabelRule:
+    label: str
+    account_name: str | None = None
+    direction: str | None = None
+    description: str | None = None
+    regex: bool = False
+
+
+label_rules = [
+    LabelRule("OffsetDown", account_name="Offset", direction="debit"),
+    LabelRule("OffsetUp", account_name="Offset", direction="credit"),
+    LabelRule("Interest", direction="debit", description="Interest"),
+    LabelRule("Redraw", direction="debit"),
+    LabelRule("Repayment", direction="credit", description="Repayment"),
+    LabelRule("Extrarepayment", direction="credit"),
+]
+
+default_label = "Unknown"
+
+
+def label_transactions(df: pd.DataFrame, rules=None) -> pd.Series:
+    # note: same as label_row for the default rules, but vectorized over all transactions
+
+    rules = label_rules if rules is None else rules
+
+    directions = {
+        None: np.ones(len(df), dtype=bool),
+        "debit": (df["Debit"] < 0).to_numpy(),
+        "credit": (df["Credit"] > 0).to_numpy(),
+    }
+
+    conditions = []
+    for rule in rules:
+        if rule.direction not in directions:
+            raise ValueError("Unsupported direction: " + str(rule.direction))
+
+        condition = directions[rule.direction]
+        if rule.account_name is not None:
+            condition = condition & (df["AccountName"] == rule.account_name).to_numpy()
+        if rule.description is not None:
+            condition = condition & df["Description"].str.contains(
+                rule.description, regex=rule.regex, na=False
+            ).to_numpy(dtype=bool)
+        conditions.append(condition)
+
+    labels = np.select(
+        conditions, [rule.label for rule in rules], default=default_label
+    )
+    return pd.Series(labels, index=df.index)
 
 
 def label_row(row) -> str:
+    # note: the default rules for a single transaction, see label_transactions
+
     if row["AccountName"] == "Offset":
         if row["Debit"] < 0:
             return "OffsetDown"
@@ -54,14 +389,81 @@ def label_row(row) -> str:
 
 
 def read_accounts_from_folders(
-    data_folder, date_from=None, date_to=None
+    data_folder,
+    date_from=None,
+    date_to=None,
+    use_manifest=True,
+    workers=None,
+    timings=None,
+    label_rules=None,
 ) -> pd.DataFrame:
+    # note: with workers, the statements of all accounts are read concurrently on a thread pool,
+    #       either way, all statements are collected first, and concatenated and sorted once,
+    #       with timings (a list), (file, seconds) is appended to it for each statement or partition read,
+    #       with label_rules, the transactions are labelled by them instead of the default rules
+
     path_loans = join(data_folder, "Loans")
 
-    df = None
-    df = read_account_from_folder(path_loans, "Fixed", df)
-    df = read_account_from_folder(path_loans, "Variable", df)
-    df = read_account_from_folder(path_loans, "Offset", df)
+    # note: the manifest is only loaded if any partition is out of date
+
+    manifest = None
+
+    accounts = []
+    frames = []
+
+    with ThreadPoolExecutor(workers) if workers else nullcontext() as executor:
+        for account_name in account_names:
+            sources = None
+
+            if use_manifest:
+                sources = get_statement_sources(path_loans, account_name)
+
+                start = time.perf_counter()
+                df_account = read_partition(data_folder, account_name, sources)
+                if df_account is not None:
+                    if timings is not None:
+                        timings.append(
+                            (
+                                get_partition_file(data_folder, account_name),
+                                time.perf_counter() - start,
+                            )
+                        )
+                    accounts.append((account_name, None, [df_account]))
+                    continue
+
+                if manifest is None:
+                    manifest = load_manifest(data_folder)
+
+            statements = iter_statements(
+                path_loans, account_name, manifest, executor, timings
+            )
+            accounts.append((account_name, sources, statements))
+
+        for account_name, sources, statements in accounts:
+            statements = list(statements)
+            if sources is not None and len(statements) > 0:
+                write_partition(
+                    data_folder,
+                    account_name,
+                    pd.concat(statements, ignore_index=True),
+                    sources,
+                )
+            frames.extend(statements)
+
+    df = pd.concat(frames, ignore_index=True)
+
+    if manifest is not None:
+        for file in [file for file in manifest if not isfile(file)]:
+            del manifest[file]  # note: statements that are no longer there
+        save_manifest(data_folder, manifest)
+
+    return _get_transactions(df, date_from, date_to, label_rules)
+
+
+def _get_transactions(
+    df: pd.DataFrame, date_from=None, date_to=None, label_rules=None
+) -> pd.DataFrame:
+    # note: the statements of all accounts, concatenated in account order, to transactions
 
     df.drop_duplicates(
         inplace=True, subset=["Date", "Description", "Credit", "Debit", "Balance"]
@@ -77,11 +479,101 @@ def read_accounts_from_folders(
     df["OriginalIndex"] = df.index
     df.reset_index(inplace=True, drop=True)
 
-    df["Label"] = df.apply(label_row, axis=1)
+    df["Label"] = label_transactions(df, label_rules)
 
     return df
 
 
-def get_dataframe(data_folder, date_from=None, date_to=None):
-    df = read_accounts_from_folders(data_folder, date_from, date_to)
+# uploads
+# note: statements can also be read from memory, either from a zip file (a path or a file-like object)
+#       laid out like a data folder (Loans/<account>/<statement>.csv), or from (account, file-like) pairs,
+#       the statements of a zip file are kept by the hash of its content, thus reruns reuse them
+
+upload_cache_size = 8
+
+_upload_cache = OrderedDict()
+_upload_cache_lock = threading.Lock()
+
+
+def _read_statements(statements) -> pd.DataFrame:
+    # note: in account order, each in the order given, statements of other accounts are ignored
+
+    frames = {account_name: [] for account_name in account_names}
+    for index, (account_name, file) in enumerate(statements):
+        if account_name in frames:
+            name = getattr(file, "name", None) or "statement " + str(index)
+            frames[account_name].append(_parse_statement(name, account_name, file))
+
+    return pd.concat(
+        [frame for account_name in account_names for frame in frames[account_name]],
+        ignore_index=True,
+    )
+
+
+def read_accounts_from_statements(
+    statements, date_from=None, date_to=None, label_rules=None
+) -> pd.DataFrame:
+    return _get_transactions(
+        _read_statements(statements), date_from, date_to, label_rules
+    )
+
+
+def _iter_zip_statements(zip_file: zipfile.ZipFile):
+    for member in zip_file.infolist():
+        parts = member.filename.split("/")
+        if (
+            not member.is_dir()
+            and len(parts) >= 3
+            and parts[-3] == "Loans"
+            and parts[0] != "__MACOSX"
+            and ".csv" in parts[-1]
+        ):
+            with zip_file.open(member) as file:
+                yield parts[-2], file
+
+
+def read_accounts_from_zip(
+    upload, date_from=None, date_to=None, label_rules=None
+) -> pd.DataFrame:
+    if isinstance(upload, (str, PathLike)):
+        with open(upload, "rb") as file:
+            content = file.read()
+    elif hasattr(upload, "getvalue"):
+        content = upload.getvalue()
+    else:
+        upload.seek(0)
+        content = upload.read()
+
+    key = hashlib.sha256(content).hexdigest()
+
+    with _upload_cache_lock:
+        df = _upload_cache.get(key)
+        if df is not None:
+            _upload_cache.move_to_end(key)
+
+    if df is None:
+        with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+            df = _read_statements(_iter_zip_statements(zip_file))
+
+        with _upload_cache_lock:
+            _upload_cache[key] = df
+            while len(_upload_cache) > upload_cache_size:
+                _upload_cache.popitem(last=False)
+
+    # note: the cached statements are not changed by turning them into transactions
+    return _get_transactions(df.copy(), date_from, date_to, label_rules)
+
+
+def get_dataframe(
+    data_folder,
+    date_from=None,
+    date_to=None,
+    use_manifest=True,
+    workers=None,
+    timings=None,
+    label_rules=None,
+):
+    df = read_accounts_from_folders(
+        data_folder, date_from, date_to, use_manifest, workers, timings, label_rules
+    )
     return df
@@ -9,7 +9,6 @@ import home_loan_planner
 from datetime import timedelta
 import math
 import os
-import shutil
 import zipfile
 
 # config
@@ -49,6 +48,14 @@ schedule_format = {
     "Stash": "${:,.0f}",
 }
 
+
+def format_schedule(df):
+    # note: durations are only added to schedules for display
+    return home_loan_simulator.add_durations(
+        df, loan_start=loan_start, schedule_start=schedule_start
+    ).style.format(schedule_format)
+
+
 interpolation_format = {
     "DateSeries": lambda x: x.strftime("%d/%m/%Y"),
     "Change": "${:,.0f}",
@@ -76,20 +83,18 @@ st.title("Home Loan")
 # aquire data
 
 data_folder = None
+data_upload = None
 data_text = None
 data_color = None
 
 # option 1: using uploaded/external data
+# note: the zip file is read in memory, and its statements are kept by its hash,
+#       thus nothing is extracted, and concurrent sessions do not share a folder
 browser_file = st.file_uploader("Upload account statements")
 
 if browser_file is not None:
-    data_folder_test = "external_data"
-    if os.path.isdir(data_folder_test):
-        shutil.rmtree(data_folder_test)
-    with zipfile.ZipFile(browser_file, "r") as zip_file:
-        zip_file.extractall(data_folder_test)
-    if os.path.isdir(data_folder_test) and len(os.listdir(data_folder_test)) > 0:
-        data_folder = data_folder_test
+    if zipfile.is_zipfile(browser_file):
+        data_upload = browser_file
         data_text = "Using uploaded data."
         data_color = "green"
 
@@ -104,8 +109,8 @@ else:
 # option 3: using demo data
 create_demo_data = st.toggle(
     "Use demo data",
-    value=data_folder is None,
-    disabled=data_folder is None,
+    value=data_folder is None and data_upload is None,
+    disabled=data_folder is None and data_upload is None,
 )
 
 if create_demo_data:
@@ -125,13 +130,14 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-df_in = (
-    account_reader.get_dataframe(data_folder, date_from=loan_start)
-    if not create_demo_data
-    else account_demo.create_demo_account(
+if create_demo_data:
+    df_in = account_demo.create_demo_account(
         demo_start=loan_start, demo_end=pd.to_datetime("today")
     )
-)
+elif data_upload is not None:
+    df_in = account_reader.read_accounts_from_zip(data_upload, date_from=loan_start)
+else:
+    df_in = account_reader.get_dataframe(data_folder, date_from=loan_start)
 
 df_in = account_interpreter.add_interest_information(df_in)
 
@@ -821,7 +827,7 @@ with tab_fixed:
             + f"${(repayment_total_fixed / 14 * (365 / 12)):,.0f}]"
         )
 
-    df_schedule_fixed = home_loan_simulator.simulate(
+    df_schedule_fixed = home_loan_simulator.simulation_cache.simulate(
         loan_start=loan_start,
         principal=balance_fixed,
         offset=0,
@@ -836,7 +842,7 @@ with tab_fixed:
         schedule_end=fixed_loan_end,
     )
 
-    df_schedule_fixed_wo_extra = home_loan_simulator.simulate(
+    df_schedule_fixed_wo_extra = home_loan_simulator.simulation_cache.simulate(
         loan_start=loan_start,
         principal=balance_fixed,
         offset=0,
@@ -852,7 +858,7 @@ with tab_fixed:
     )
 
     with st.expander("Detailed schedule"):
-        st.write(df_schedule_fixed.style.format(schedule_format))
+        st.write(format_schedule(df_schedule_fixed))
 
     total_years_fixed = df_schedule_fixed.iloc[-1]["ScheduleYears"]
     total_repayment_fixed = df_schedule_fixed["Repayment"].sum()
@@ -890,7 +896,7 @@ with tab_fixed:
         st.write("##### Other schedules")
 
         with st.expander("Detailed schedule: w/o extra repayment"):
-            st.write(df_schedule_fixed_wo_extra.style.format(schedule_format))
+            st.write(format_schedule(df_schedule_fixed_wo_extra))
 
     st.divider()
     st.write("##### Sums")
@@ -1191,137 +1197,85 @@ with tab_variable:
             + ")]"
         )
 
-    df_schedule_variable = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-    )
+    # note: all variable scenarios share their dates, thus they are simulated together,
+    #       in the order: base, w/o extra, hope, fear, save, spend, invest
 
-    df_schedule_variable_wo_extra = home_loan_simulator.simulate(
+    df_schedule_variable_batch = home_loan_simulator.simulation_cache.simulate_batch(
         loan_start=loan_start,
-        principal=balance_variable,
+        principal=[
+            balance_variable,
+            balance_variable,
+            balance_variable,
+            balance_variable,
+            balance_variable - save_amount,
+            balance_variable + spend_amount,
+            balance_variable + invest_cost_amount,
+        ],
         offset=extracted_offset,
         schedule_start=schedule_start,
-        interest_rate=interest_variable,
+        interest_rate=[
+            interest_variable,
+            interest_variable,
+            interest_variable - hope_interest_change,
+            interest_variable + fear_interest_change,
+            interest_variable,
+            interest_variable,
+            interest_variable,
+        ],
         prev_interest_date=prev_interest_date,
         interest_cycle=interest_cycle,
-        repayment=repayment_variable,
+        repayment=[
+            repayment_total_variable,
+            repayment_variable,
+            repayment_total_variable,
+            repayment_total_variable,
+            repayment_total_variable,
+            repayment_total_variable,
+            repayment_total_variable,
+        ],
         prev_repayment_date=prev_repayment_date,
         repayment_cycle=repayment_cycle,
         repayment_use_stash=repayment_use_stash,
         schedule_end=None,
         leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance_wo_extra,
-        leftover_repayment=repayment_fixed,
-    )
-
-    df_schedule_variable_hope = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable - hope_interest_change,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-    )
-
-    df_schedule_variable_fear = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable + fear_interest_change,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-    )
-
-    df_schedule_variable_save = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable - save_amount,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-    )
-
-    df_schedule_variable_spend = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable + spend_amount,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-    )
-
-    df_schedule_variable_invest = home_loan_simulator.simulate(
-        loan_start=loan_start,
-        principal=balance_variable + invest_cost_amount,
-        offset=extracted_offset,
-        schedule_start=schedule_start,
-        interest_rate=interest_variable,
-        prev_interest_date=prev_interest_date,
-        interest_cycle=interest_cycle,
-        repayment=repayment_total_variable,
-        prev_repayment_date=prev_repayment_date,
-        repayment_cycle=repayment_cycle,
-        repayment_use_stash=repayment_use_stash,
-        schedule_end=None,
-        leftover_incoming=fixed_loan_end,
-        leftover_amount=end_of_fixed_loan_balance,
-        leftover_repayment=repayment_total_fixed,
-        extra_win_amount=invest_win_amount,
+        leftover_amount=[
+            end_of_fixed_loan_balance,
+            end_of_fixed_loan_balance_wo_extra,
+            end_of_fixed_loan_balance,
+            end_of_fixed_loan_balance,
+            end_of_fixed_loan_balance,
+            end_of_fixed_loan_balance,
+            end_of_fixed_loan_balance,
+        ],
+        leftover_repayment=[
+            repayment_total_fixed,
+            repayment_fixed,
+            repayment_total_fixed,
+            repayment_total_fixed,
+            repayment_total_fixed,
+            repayment_total_fixed,
+            repayment_total_fixed,
+        ],
+        extra_win_amount=[None, None, None, None, None, None, invest_win_amount],
         extra_win_cycle=invest_win_cycle,
-        extra_win_duration=invest_win_duration,
+        extra_win_duration=[None, None, None, None, None, None, invest_win_duration],
     )
 
+    (
+        df_schedule_variable,
+        df_schedule_variable_wo_extra,
+        df_schedule_variable_hope,
+        df_schedule_variable_fear,
+        df_schedule_variable_save,
+        df_schedule_variable_spend,
+        df_schedule_variable_invest,
+    ) = [
+        df_schedule.drop(columns="Scenario").reset_index(drop=True)
+        for _, df_schedule in df_schedule_variable_batch.groupby("Scenario")
+    ]
+
     with st.expander("Detailed schedule"):
-        st.write(df_schedule_variable.style.format(schedule_format))
+        st.write(format_schedule(df_schedule_variable))
 
     total_years_variable = df_schedule_variable.iloc[-1]["ScheduleYears"]
     variable_loan_end = df_schedule_variable.iloc[-1]["Date"]
@@ -1372,23 +1326,23 @@ with tab_variable:
         st.write("##### Other Schedules")
 
         with st.expander("Detailed schedule: w/o extra repayment"):
-            st.write(df_schedule_variable_wo_extra.style.format(schedule_format))
+            st.write(format_schedule(df_schedule_variable_wo_extra))
 
         if show_fear_save_spend_invest_information:
             with st.expander("Detailed schedule: hope"):
-                st.write(df_schedule_variable_hope.style.format(schedule_format))
+                st.write(format_schedule(df_schedule_variable_hope))
 
             with st.expander("Detailed schedule: fear"):
-                st.write(df_schedule_variable_fear.style.format(schedule_format))
+                st.write(format_schedule(df_schedule_variable_fear))
 
             with st.expander("Detailed schedule: save"):
-                st.write(df_schedule_variable_save.style.format(schedule_format))
+                st.write(format_schedule(df_schedule_variable_save))
 
             with st.expander("Detailed schedule: spend"):
-                st.write(df_schedule_variable_spend.style.format(schedule_format))
+                st.write(format_schedule(df_schedule_variable_spend))
 
             with st.expander("Detailed schedule: invest"):
-                st.write(df_schedule_variable_invest.style.format(schedule_format))
+                st.write(format_schedule(df_schedule_variable_invest))
 
     st.divider()
     st.write("##### Sums")
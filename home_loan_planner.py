@@ -1,12 +1,202 @@
+import math
+import numpy as np
+import pandas as pd
+
+# note: the same columns as home_loan_simulator.schedule_columns
+
+amortization_columns = [
+    "Date",
+    "LoanYears",
+    "ScheduleYears",
+    "Interest",
+    "Redraw",
+    "Repayment",
+    "Stashed",
+    "Principal",
+    "Stash",
+    "ExtraWinForLoan",
+    "ExtraWinForUs",
+]
+
+
 class HomeLoanPlanner:
 
     @staticmethod
     def get_recurring_payment_c(*, n, p, r):
         if p <= 0 or n == 0:
             return None
+        if r == 0:
+            return p / n
         return p * (r * (1 + r) ** n) / ((1 + r) ** n - 1)
 
+    @staticmethod
+    def get_recurring_payments_c(*, n, p, r):
+        # note: same as get_recurring_payment_c, but for (broadcastable) arrays,
+        #       NaN where get_recurring_payment_c returns None
+
+        n, p, r = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (n, p, r))
+        )
+
+        valid = (p > 0) & (n != 0)
+        growth = (1 + r) ** n
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = np.where(r == 0, p / n, p * (r * growth) / (growth - 1))
+
+        return np.where(valid, c, np.nan)
+
+    @staticmethod
+    def get_payment_count_n(*, c, p, r):
+        # note: inverse of get_recurring_payments_c, the number of payments c to repay p,
+        #       inf where c never repays p (c <= p * r), 0 where there is nothing to repay
+
+        c, p, r = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (c, p, r))
+        )
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            n = np.where(
+                r == 0, p / c, -np.log1p(-np.minimum(1, r * p / c)) / np.log1p(r)
+            )
+
+        n = np.where(c <= r * p, np.inf, n)
+        return np.where(p <= 0, 0.0, n)[()]
+
+    @staticmethod
+    def get_principal_p(*, c, n, r):
+        # note: inverse of get_recurring_payments_c, the principal repaid by n payments c
+
+        c, n, r = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (c, n, r))
+        )
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = np.where(r == 0, c * n, c * -np.expm1(-n * np.log1p(r)) / r)
+
+        return p[()]
+
+    @staticmethod
+    def get_rate_r(*, c, n, p, iterations=50, tolerance=1e-12):
+        # note: inverse of get_recurring_payments_c, the rate at which n payments c repay p,
+        #       solved by Newton's method with the analytic derivative of c(r),
+        #       NaN where there is no positive rate (c * n < p), 0 where c * n == p
+
+        c, n, p = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (c, n, p))
+        )
+
+        valid = (p > 0) & (n > 0) & (c * n > p)
+
+        # note: starting from the first order approximation c = p / n * (1 + r * (n + 1) / 2)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.where(valid, 2 * (c * n / p - 1) / (n + 1), 1.0)
+
+            for _ in range(iterations):
+                g = np.exp(n * np.log1p(r))
+                f = p * r * g / (g - 1) - c
+                df = p * g / (g - 1) * (1 - r * n / (1 + r) / (g - 1))
+
+                step = np.where(valid, f / df, 0)
+                r = np.maximum(r - step, r / 2)
+                if np.all(np.abs(step) <= tolerance * np.maximum(1, np.abs(r))):
+                    break
+
+        r = np.where(valid, r, np.nan)
+        return np.where((p > 0) & (c * n == p), 0.0, r)[()]
+
+    @staticmethod
+    def get_amortization_amounts(*, c, p, r, n, offset=0):
+        # note: the amounts of repaying p by up to n payments c, at the rate r per payment,
+        #       with interest on the principal above offset only (as with an offset account),
+        #       one column per payment, one row per amount of amortization_columns,
+        #       column 0 is the start, the payments stop once p is repaid
+
+        amounts = np.full((len(amortization_columns) - 3, 1), np.nan)
+        amounts[:, 0] = (0, p, 0, 0, p, 0, 0, 0)
+        if p <= 0:
+            return amounts
+
+        # note: the principal above offset before payment t has the closed form
+        #       d_t = d_0 * (1 + r)^t - c * ((1 + r)^t - 1) / r, as long as it is positive,
+        #       from then on it stays negative, and no interest is charged
+
+        t = np.arange(n)
+        if r == 0:
+            owing = (p - offset) - c * t
+        else:
+            growth = np.exp(t * np.log1p(r))
+            owing = (p - offset) * growth - c * (growth - 1) / r
+
+        interest = r * np.maximum(0, owing)
+        principal = p + np.cumsum(interest - c)
+
+        repaid = np.flatnonzero(principal <= 0)
+        m = repaid[0] + 1 if len(repaid) > 0 else n
+
+        amounts = np.concatenate([amounts, np.full((len(amounts), m), np.nan)], axis=1)
+        amounts[0, 1:] = interest[:m]
+        amounts[2, 1:] = c
+        amounts[3, 1:] = 0
+        amounts[4, 1:] = principal[:m]
+        amounts[5, 1:] = 0
+
+        if len(repaid) > 0:
+            amounts[2, m] = c + principal[m - 1]
+            amounts[3, m] = -principal[m - 1]
+            amounts[4, m] = 0
+            amounts[5, m] = -principal[m - 1]
+
+        return amounts
+
+    def get_amortization_schedule(
+        self, *, loan_start, schedule_start, c=None, offset=0, dates=None
+    ) -> pd.DataFrame:
+        # note: the schedule of repaying P by payments c (c0 by default) every 365 / k days,
+        #       or on dates (after schedule_start), with the same columns as home_loan_simulator.simulate,
+        #       only for a planner of single values
+
+        c = self.c0 if c is None else c
+
+        if dates is None:
+            n = self.get_payment_count_n(c=c, p=self.P, r=self.r0)
+            if not np.isfinite(n):
+                raise ValueError("Payments do not repay the principal")
+            n = math.ceil(n - 1e-9)
+            dates = schedule_start + pd.to_timedelta(
+                np.arange(1, n + 1) * (365 / self.k), unit="D"
+            )
+
+        amounts = self.get_amortization_amounts(
+            c=c, p=self.P, r=self.r0, n=len(dates), offset=offset
+        )
+
+        dates = pd.DatetimeIndex([schedule_start]).append(
+            pd.DatetimeIndex(dates[: amounts.shape[1] - 1])
+        )
+
+        columns = {
+            "Date": dates,
+            "LoanYears": ((dates - loan_start).days / 365).to_numpy(),
+            "ScheduleYears": ((dates - schedule_start).days / 365).to_numpy(),
+        }
+        for column, values in zip(amortization_columns[3:], amounts):
+            columns[column] = values
+
+        return pd.DataFrame(columns, columns=amortization_columns, copy=False)
+
     def __init__(self, label, *, N, k, P, R0):
+        # note: N, k, P and R0 can also be (broadcastable) arrays, then n, r0, c0 and m0 are arrays
+
+        if any(np.ndim(value) > 0 for value in (N, k, P, R0)):
+            N, k, P, R0 = np.broadcast_arrays(
+                *(np.asarray(value, dtype=float) for value in (N, k, P, R0))
+            )
+            get_recurring_payment_c = self.get_recurring_payments_c
+        else:
+            get_recurring_payment_c = self.get_recurring_payment_c
+
         self.label = label
         self.N = N
         self.k = k
@@ -15,5 +205,5 @@ class HomeLoanPlanner:
 
         self.n = self.N * self.k
         self.r0 = self.R0 / self.k
-        self.c0 = self.get_recurring_payment_c(n=self.n, p=self.P, r=self.r0)
+        self.c0 = get_recurring_payment_c(n=self.n, p=self.P, r=self.r0)
         self.m0 = self.c0 * self.k / 12
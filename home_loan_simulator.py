@@ -1,8 +1,20 @@
 from enum import Enum
-from datetime import timedelta
+from typing import NamedTuple
+from dataclasses import dataclass, replace
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import lru_cache
+from multiprocessing import shared_memory
+import bisect
+import hashlib
+import math
+import threading
+import time
 from dateutil.relativedelta import relativedelta
 import pandas as pd
 import numpy as np
+import home_loan_planner
 
 
 class Cycle(Enum):
@@ -34,6 +46,13 @@ class Cycle(Enum):
     def is_yearly(self):
         return self in [Cycle.YEARLY]
 
+    def per_year(self):
+        if self.is_fortnightly():
+            return 365 / 14
+        if self.is_monthly():
+            return 12
+        return 1
+
 
 def increment_date(date: pd.Timestamp, cycle: Cycle) -> pd.Timestamp:
     if cycle == Cycle.FORTNIGHTLY:
@@ -79,9 +98,659 @@ def increment_date(date: pd.Timestamp, cycle: Cycle) -> pd.Timestamp:
     raise ValueError("Invalid cycle")
 
 
-def simulate(
+def _get_cycle_dates(
+    anchor: pd.Timestamp, cycle: Cycle, horizon: pd.Timestamp
+) -> np.ndarray:
+    # note: vectorized version of applying increment_date over and over again,
+    #       from anchor until the first date after horizon
+
+    anchor = pd.Timestamp(anchor).as_unit("ns")
+
+    if cycle in [Cycle.FORTNIGHTLY, Cycle.MONTHLY_AVERAGE, Cycle.YEARLY]:
+        step = {
+            Cycle.FORTNIGHTLY: timedelta(days=14),
+            Cycle.MONTHLY_AVERAGE: timedelta(days=365 / 12),
+            Cycle.YEARLY: timedelta(days=365),
+        }[cycle]
+        step = pd.Timedelta(step).value
+
+        count = max(1, (pd.Timestamp(horizon) - anchor).value // step + 1)
+        steps = np.arange(1, count + 1, dtype=np.int64)
+
+        return (anchor.value + steps * step).astype("datetime64[ns]")
+
+    if cycle in [Cycle.MONTHLY_1ST_OF_MONTH, Cycle.MONTHLY_END_OF_MONTH]:
+        horizon = pd.Timestamp(horizon)
+        time_of_day = (anchor - anchor.normalize()).value
+
+        count = max(
+            1, (horizon.year - anchor.year) * 12 + (horizon.month - anchor.month) + 2
+        )
+        months = np.arange(1, count + 1)
+        shift = 0
+
+        if cycle == Cycle.MONTHLY_END_OF_MONTH:
+            # note: the end of a month is the day before the first of the next month,
+            #       if anchor is not at the end of the month, the first date is the end of this month
+
+            date_is_last_day_of_month = (
+                anchor + timedelta(days=1)
+            ).month != anchor.month
+            if not date_is_last_day_of_month:
+                months = months - 1
+            shift = -pd.Timedelta(days=1).value
+            months = months + 1
+
+        first_of_months = np.datetime64(anchor.strftime("%Y-%m"), "M") + months
+
+        dates = (
+            first_of_months.astype("datetime64[ns]").astype(np.int64)
+            + shift
+            + time_of_day
+        ).astype("datetime64[ns]")
+
+        return dates[
+            : np.searchsorted(dates, horizon.as_unit("ns").to_datetime64(), "right") + 1
+        ]
+
+    raise ValueError("Invalid cycle")
+
+
+one_day = timedelta(days=1)
+max_schedule_days = 100 * 365
+
+amount_columns = [
+    "Interest",
+    "Redraw",
+    "Repayment",
+    "Stashed",
+    "Principal",
+    "Stash",
+    "ExtraWinForLoan",
+    "ExtraWinForUs",
+]
+
+schedule_columns = ["Date", "LoanYears", "ScheduleYears"] + amount_columns
+
+
+def _days_until(start: pd.Timestamp, date: pd.Timestamp) -> int:
+    # number of whole days to step from start until date is reached or passed
+    return -(-pd.Timedelta(date - start).value // pd.Timedelta(one_day).value)
+
+
+class _Event(NamedTuple):
+    day: int
+    date: pd.Timestamp
+    interest_period: tuple[pd.Timestamp, pd.Timestamp] | None
+    redraw: bool
+    repayment: bool
+    extra_win: bool
+    maturity: bool
+
+
+@dataclass
+class _EventState:
+    # note: where the event timeline is, after the event on day,
+    #       i.e. the indexes of the next events in the calendars
+
+    day: int = 0
+    prev_interest_date: pd.Timestamp | None = None
+    interest_index: int = 0
+    repayment_index: int = 0
+    extra_win_index: int = 0
+    redraw_done: bool = False
+
+
+class CycleCalendar:
+    # note: all dates of a cycle, from anchor (excluded) up to the first date after horizon,
+    #       i.e. calendar[i] is the same as applying increment_date i + 1 times to anchor
+
+    def __init__(self, anchor: pd.Timestamp, cycle: Cycle, horizon: pd.Timestamp):
+        self.anchor = anchor
+        self.cycle = cycle
+        self.horizon = horizon
+
+        self.dates = _get_cycle_dates(anchor, cycle, horizon)
+        self.dates.flags.writeable = False
+
+        self._days = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index) -> pd.Timestamp:
+        return pd.Timestamp(self.dates[index])
+
+    def get_days(self, start: pd.Timestamp) -> list[int]:
+        # note: for each date, the number of whole days to step from start until the date is reached
+
+        if start not in self._days:
+            offsets = (
+                self.dates.astype(np.int64) - pd.Timestamp(start).as_unit("ns").value
+            )
+            self._days[start] = (-(-offsets // pd.Timedelta(one_day).value)).tolist()
+        return self._days[start]
+
+
+@lru_cache(maxsize=256)
+def get_cycle_calendar(
+    anchor: pd.Timestamp, cycle: Cycle, horizon: pd.Timestamp
+) -> CycleCalendar:
+    return CycleCalendar(anchor, cycle, horizon)
+
+
+def _iter_events(
     *,
+    schedule_start: pd.Timestamp,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    schedule_end: pd.Timestamp | None = None,
+    redraw_date: pd.Timestamp | None = None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_end: pd.Timestamp | None = None,
+    state: _EventState | None = None,
+):
+    # note: when events happen only depends on dates, not on amounts,
+    #       thus it is up to the caller to stop once the loan is finished,
+    #       at the latest after the safety limit or at maturity,
+    #       if state is given, the timeline continues from it, and state is kept up to date
+
+    curr_day = 0
+
+    horizon_day = max_schedule_days + 2
+
+    maturity_day = None
+    if schedule_end is not None:
+        maturity_day = max(1, _days_until(schedule_start, schedule_end))
+        horizon_day = min(horizon_day, maturity_day)
+
+    horizon = schedule_start + horizon_day * one_day
+
+    # note: the next event of each cycle is looked up by index in its calendar
+
+    interest_calendar = get_cycle_calendar(prev_interest_date, interest_cycle, horizon)
+    interest_days = interest_calendar.get_days(schedule_start)
+    interest_index = 0
+
+    repayment_calendar = get_cycle_calendar(
+        prev_repayment_date, repayment_cycle, horizon
+    )
+    repayment_days = repayment_calendar.get_days(schedule_start)
+    repayment_index = 0
+
+    extra_win_days = None
+    if extra_win_cycle is not None:
+        extra_win_days = get_cycle_calendar(
+            schedule_start, extra_win_cycle, horizon
+        ).get_days(schedule_start)
+        extra_win_index = 0
+
+    redraw_day = None
+    if redraw_date is not None:
+        redraw_day = _days_until(schedule_start, redraw_date)
+
+    if state is not None and state.day > 0:
+        curr_day = state.day
+        prev_interest_date = state.prev_interest_date
+        interest_index = state.interest_index
+        repayment_index = state.repayment_index
+        if extra_win_days is not None:
+            extra_win_index = state.extra_win_index
+        if state.redraw_done:
+            redraw_day = None
+
+    while True:
+        # next event day
+
+        event_days = [
+            max(curr_day + 1, interest_days[interest_index]),
+            max(curr_day + 1, repayment_days[repayment_index]),
+        ]
+
+        if redraw_day is not None:
+            event_days.append(max(curr_day + 1, redraw_day))
+
+        if extra_win_days is not None:
+            extra_win_day = max(curr_day + 1, extra_win_days[extra_win_index])
+            if (
+                extra_win_end is None
+                or schedule_start + extra_win_day * one_day <= extra_win_end
+            ):
+                event_days.append(extra_win_day)
+
+        if maturity_day is not None:
+            event_days.append(max(curr_day + 1, maturity_day))
+
+        curr_day = min(event_days)
+        curr_date = schedule_start + curr_day * one_day
+
+        maturity_is_today = maturity_day is not None and curr_day >= maturity_day
+
+        # interest
+
+        interest_period = None
+        if curr_day >= interest_days[interest_index] or maturity_is_today:
+            curr_interest_date = (
+                interest_calendar[interest_index]
+                if not maturity_is_today
+                else curr_date
+            )
+            interest_period = (prev_interest_date, curr_interest_date)
+
+            prev_interest_date = curr_interest_date
+            interest_index = interest_index + 1
+
+        # redraw
+
+        redraw_is_today = redraw_day is not None and curr_day >= redraw_day
+        if redraw_is_today:
+            redraw_day = None  # making sure the redraw only happens once
+
+        # repayment
+
+        repayment_is_today = curr_day >= repayment_days[repayment_index]
+        if repayment_is_today:
+            repayment_index = repayment_index + 1
+
+        # extra win
+
+        extra_win_is_today = (
+            extra_win_days is not None
+            and curr_day >= extra_win_days[extra_win_index]
+            and (extra_win_end is None or curr_date <= extra_win_end)
+        )
+        if extra_win_is_today:
+            extra_win_index = extra_win_index + 1
+
+        if state is not None:
+            state.day = curr_day
+            state.prev_interest_date = prev_interest_date
+            state.interest_index = interest_index
+            state.repayment_index = repayment_index
+            state.extra_win_index = extra_win_index if extra_win_days is not None else 0
+            state.redraw_done = state.redraw_done or redraw_is_today
+
+        yield _Event(
+            curr_day,
+            curr_date,
+            interest_period,
+            redraw_is_today,
+            repayment_is_today,
+            extra_win_is_today,
+            maturity_is_today,
+        )
+
+        if maturity_is_today:
+            return
+
+
+cent_roundings = ["half_even", "half_up", "down", "up"]
+
+
+def _round_cents(cents, rounding):
+    # note: works on a single amount as well as on an array of amounts,
+    #       single amounts become int, arrays stay float (whole cents, NaN for none)
+
+    if rounding == "half_even":
+        rounded = np.rint(cents)
+    elif rounding == "half_up":
+        rounded = np.floor(cents + 0.5)
+    elif rounding == "down":
+        rounded = np.floor(cents)
+    elif rounding == "up":
+        rounded = np.ceil(cents)
+    else:
+        raise ValueError("Unsupported rounding: " + str(rounding))
+
+    return rounded if isinstance(rounded, np.ndarray) else int(rounded)
+
+
+def _to_cents(amount):
+    # note: amounts in dollars become whole cents, rounded half to even
+
+    if amount is None:
+        return None
+    if isinstance(amount, OffsetSchedule):
+        return OffsetSchedule(
+            amount.dates, [round(value * 100) for value in amount.values]
+        )
+    if isinstance(amount, np.ndarray):
+        return np.rint(amount * 100)
+    return round(amount * 100)
+
+
+def _is_running(
+    principal,
+    date: pd.Timestamp,
+    leftover_incoming: pd.Timestamp | None,
+    extra_win_end: pd.Timestamp | None,
+):
+    # note: works on a single principal as well as on an array of principals
+
+    return (
+        (principal > 0)
+        | (leftover_incoming is not None and date <= leftover_incoming)
+        | (extra_win_end is not None and date <= extra_win_end)
+    )
+
+
+def _get_interest_years(interest_period) -> float:
+    prev_interest_date, curr_interest_date = interest_period
+    curr_interest_length = curr_interest_date - prev_interest_date
+    return (curr_interest_length.days / float(365)) + (
+        curr_interest_length.seconds / float(60 * 60 * 24 * 365)
+    )
+
+
+class StepSchedule:
+    # note: piecewise constant values, values[i] applies from dates[i] (included)
+    #       up to dates[i + 1] (excluded), the first value also applies before dates[0],
+    #       values are looked up by binary search, i.e. O(log k) for k changes
+
+    def __init__(self, dates, values):
+        self.dates = [pd.Timestamp(date).as_unit("ns").value for date in dates]
+        self.values = [float(value) for value in values]
+        self.day_value = pd.Timedelta(one_day).value
+
+        if len(self.dates) == 0 or len(self.dates) != len(self.values):
+            raise ValueError("Schedule needs one value per date")
+        if any(a >= b for a, b in zip(self.dates, self.dates[1:])):
+            raise ValueError("Schedule dates need to be strictly increasing")
+
+        # note: running sum of value times days, from dates[0] up to each date
+
+        self.value_days = [0.0]
+        for i in range(1, len(self.dates)):
+            days = (self.dates[i] - self.dates[i - 1]) / self.day_value
+            self.value_days.append(self.value_days[-1] + self.values[i - 1] * days)
+
+    def _get_index(self, value) -> int:
+        return max(0, bisect.bisect_right(self.dates, value) - 1)
+
+    def get_value_at(self, value: int) -> float:
+        # note: value is a date as nanoseconds
+
+        return self.values[self._get_index(value)]
+
+    def get_value(self, date: pd.Timestamp) -> float:
+        return self.get_value_at(pd.Timestamp(date).as_unit("ns").value)
+
+    def _get_value_days_until(self, value) -> float:
+        i = self._get_index(value)
+        return self.value_days[i] + self.values[i] * (
+            (value - self.dates[i]) / self.day_value
+        )
+
+    def get_value_days(self, start: pd.Timestamp, end: pd.Timestamp) -> float:
+        # note: the sum of value times (fractional) days from start to end
+
+        return self._get_value_days_until(
+            end.as_unit("ns").value
+        ) - self._get_value_days_until(start.as_unit("ns").value)
+
+    def get_changes(self, start: pd.Timestamp, end: pd.Timestamp) -> list[int]:
+        # note: the dates (as nanoseconds) strictly between start and end where the value changes
+
+        return self.dates[
+            bisect.bisect_right(
+                self.dates, start.as_unit("ns").value
+            ) : bisect.bisect_left(self.dates, end.as_unit("ns").value)
+        ]
+
+
+class RateSchedule(StepSchedule):
+    # note: interest rates (in percent)
+
+    pass
+
+
+class OffsetSchedule(StepSchedule):
+    # note: offset balances
+
+    @classmethod
+    def from_transactions(cls, transactions, *, balance=0):
+        # note: transactions are (date, amount) pairs sorted by date, e.g. from a generator,
+        #       deposits are positive and withdrawals are negative, starting from balance
+
+        dates = []
+        balances = []
+        for date, amount in transactions:
+            date = pd.Timestamp(date)
+            if len(dates) > 0 and date == dates[-1]:
+                balances[-1] = balances[-1] + amount
+            else:
+                dates.append(date)
+                balances.append((balances[-1] if balances else balance) + amount)
+
+        # note: the initial balance applies up to the first transaction
+
+        first_date = dates[0] - one_day if dates else pd.Timestamp(0)
+        return cls([first_date] + dates, [balance] + balances)
+
+
+def _get_schedule_of(value, schedule_class):
+    # note: value is either a single value, a schedule,
+    #       or a sequence of (effective_date, value) pairs
+
+    if isinstance(value, schedule_class):
+        return value
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return schedule_class([date for date, _ in value], [item for _, item in value])
+    return None
+
+
+def _get_rate_schedule(interest_rate) -> RateSchedule | None:
+    return _get_schedule_of(interest_rate, RateSchedule)
+
+
+def _get_offset_schedule(offset) -> OffsetSchedule | None:
+    return _get_schedule_of(offset, OffsetSchedule)
+
+
+class _Accrual:
+    # note: keeps track of the amount owing back to the previous interest calculation
+    #       as a running sum of amount owing times days, the amount owing is constant between events,
+    #       by default the interest is based on the mean amount owing per day (sampled once a day),
+    #       optionally it is based on the amount owing weighted by the exact (fractional) time,
+    #       with a rate schedule, the running sum is of amount owing times rate times days,
+    #       with an offset schedule, the amount owing changes with the offset between events
+
+    def __init__(
+        self,
+        prev_interest_date: pd.Timestamp,
+        accrual_exact,
+        rate_schedule: RateSchedule | None = None,
+        offset_schedule: OffsetSchedule | None = None,
+    ):
+        self.accrual_exact = accrual_exact
+        self.rate_schedule = rate_schedule
+        self.offset_schedule = offset_schedule
+        self.owing = 0
+        self.owing_days = 0
+        self.days = 0
+        self.prev_day = 0
+        self.prev_date = prev_interest_date
+
+    def _get_owing_days(self, owing, start: pd.Timestamp, end: pd.Timestamp, days):
+        if self.offset_schedule is not None:
+            # note: the time from start to end is split wherever the offset or the rate changes
+
+            changes = self.offset_schedule.get_changes(start, end)
+            if self.rate_schedule is not None:
+                changes = sorted(
+                    set(changes).union(self.rate_schedule.get_changes(start, end))
+                )
+
+            points = [start.as_unit("ns").value, *changes, end.as_unit("ns").value]
+            owing_days = 0
+            for curr_point, next_point in zip(points, points[1:]):
+                curr_owing = max(
+                    0, owing - self.offset_schedule.get_value_at(curr_point)
+                )
+                if self.rate_schedule is not None:
+                    curr_owing = curr_owing * self.rate_schedule.get_value_at(
+                        curr_point
+                    )
+                owing_days = owing_days + curr_owing * (
+                    (next_point - curr_point) / self.offset_schedule.day_value
+                )
+            return owing_days
+
+        if self.rate_schedule is not None:
+            return owing * self.rate_schedule.get_value_days(start, end)
+
+        return owing * days
+
+    def add(self, owing, event: _Event):
+        # note: owing is the amount owing since the previous event,
+        #       or with an offset schedule, the principal since the previous event
+
+        if self.accrual_exact:
+            days = (event.date - self.prev_date) / one_day
+        else:
+            days = event.day - self.prev_day
+
+        if self.rate_schedule is None and self.offset_schedule is None:
+            owing_days = owing * days
+        else:
+            start = (
+                self.prev_date if self.accrual_exact else event.date - days * one_day
+            )
+            owing_days = self._get_owing_days(owing, start, event.date, days)
+
+        self.owing = owing
+        self.owing_days = self.owing_days + owing_days
+        self.days = self.days + days
+        self.prev_day = event.day
+        self.prev_date = event.date
+
+    def pop_interest(self, interest_period, interest_rate):
+        if self.rate_schedule is not None:
+            interest_rate = 1  # note: the rates are part of the running sum already
+
+        if self.accrual_exact:
+            # note: the time between the end of the interest period and today
+            #       belongs to the next interest period
+
+            carry = self._get_owing_days(
+                self.owing,
+                interest_period[1],
+                self.prev_date,
+                (self.prev_date - interest_period[1]) / one_day,
+            )
+            interest = (self.owing_days - carry) / 365 * (interest_rate / 100)
+            self.owing_days = carry
+        else:
+            interest = (
+                (self.owing_days / self.days)
+                * _get_interest_years(interest_period)
+                * (interest_rate / 100)
+            )
+            self.owing_days = 0
+            self.days = 0
+
+        return interest
+
+
+class _ScheduleBuffer:
+    # note: rows are written into preallocated columns, which grow by doubling when full
+
+    def __init__(self, capacity=512):
+        self.size = 0
+        self.days = np.empty(capacity, dtype=np.int64)
+        self.amounts = np.empty((len(amount_columns), capacity))
+
+    def append(self, day, amounts):
+        if self.size == len(self.days):
+            self.days = np.concatenate([self.days, np.empty_like(self.days)])
+            self.amounts = np.concatenate(
+                [self.amounts, np.empty_like(self.amounts)], axis=1
+            )
+
+        self.days[self.size] = day
+        self.amounts[:, self.size] = amounts
+        self.size = self.size + 1
+
+    def extend(self, days, amounts):
+        while self.size + len(days) > len(self.days):
+            self.days = np.concatenate([self.days, np.empty_like(self.days)])
+            self.amounts = np.concatenate(
+                [self.amounts, np.empty_like(self.amounts)], axis=1
+            )
+
+        self.days[self.size : self.size + len(days)] = days
+        self.amounts[:, self.size : self.size + len(days)] = amounts
+        self.size = self.size + len(days)
+
+
+def _get_schedule(
+    dates: pd.DatetimeIndex,
+    amounts,
     loan_start: pd.Timestamp,
+    schedule_start: pd.Timestamp,
+    extra_columns=None,
+) -> pd.DataFrame:
+    columns = dict(extra_columns or {})
+    columns["Date"] = dates
+    columns["LoanYears"] = ((dates - loan_start).days / 365).to_numpy()
+    columns["ScheduleYears"] = ((dates - schedule_start).days / 365).to_numpy()
+    for column, values in zip(amount_columns, amounts):
+        columns[column] = values
+
+    return pd.DataFrame(columns, columns=list(columns), copy=False)
+
+
+def add_durations(
+    df: pd.DataFrame, *, loan_start: pd.Timestamp, schedule_start: pd.Timestamp
+) -> pd.DataFrame:
+    # note: durations are relativedelta objects, which are expensive to create,
+    #       thus they are only added to schedules when needed, e.g. for display
+
+    df = df.copy(deep=False)
+    df.insert(
+        df.columns.get_loc("LoanYears") + 1,
+        "LoanDuration",
+        [relativedelta(date, loan_start) for date in df["Date"]],
+    )
+    df.insert(
+        df.columns.get_loc("ScheduleYears") + 1,
+        "ScheduleDuration",
+        [relativedelta(date, schedule_start) for date in df["Date"]],
+    )
+    return df
+
+
+@dataclass(frozen=True)
+class SimulationCheckpoint:
+    # note: the state of a simulation after the events on date, with the schedule up to date,
+    #       simulate(resume_from=checkpoint) only recomputes the schedule after date,
+    #       thus the parameters need to be the same up to date, and the dates and cycles
+    #       of the timeline (see timeline) need to be the same throughout,
+    #       e.g. a rate change from date onwards needs rate schedules in both simulations
+
+    date: pd.Timestamp
+    principal: float
+    stash: float
+    timeline: tuple
+    events: _EventState
+    accrual: tuple
+    days: np.ndarray
+    amounts: np.ndarray
+
+
+def get_checkpoint(checkpoints, date: pd.Timestamp) -> SimulationCheckpoint | None:
+    # note: the latest checkpoint before date, i.e. the one to resume from
+    #       when parameters change from date onwards
+
+    dates = [checkpoint.date for checkpoint in checkpoints]
+    index = bisect.bisect_left(dates, date)
+    return checkpoints[index - 1] if index > 0 else None
+
+
+def _iter_rows(
+    *,
     principal,
     offset,
     schedule_start: pd.Timestamp,
@@ -99,7 +768,24 @@ def simulate(
     extra_win_amount=None,
     extra_win_cycle: Cycle | None = None,
     extra_win_duration: pd.Timedelta | None = None,
-) -> pd.DataFrame:
+    accrual_exact=False,
+    rounding=None,
+    resume_from: SimulationCheckpoint | None = None,
+    checkpoint_days=None,
+    checkpoints=None,
+):
+    # note: the simulation is event driven, i.e. it jumps from one day with an event
+    #       (interest, redraw, repayment, extra win, maturity) straight to the next one,
+    #       the result is the same as stepping through the schedule day by day,
+    #       each row is yielded as (day, amounts), with day counted from schedule_start,
+    #       interest_rate is either a single rate or a rate schedule (see _get_rate_schedule),
+    #       offset is either a single balance or an offset schedule (see _get_offset_schedule),
+    #       with resume_from, the rows are continued after the checkpoint,
+    #       with checkpoints (a list), the state is appended to it every checkpoint_days,
+    #       with rounding (see cent_roundings), all amounts are kept as whole cents (int),
+    #       interest is rounded to cents as charged, rows are still yielded in dollars
+
+    curr_day = 0
     curr_date = schedule_start
 
     stash = 0
@@ -109,90 +795,126 @@ def simulate(
     else:
         extra_win_end = None
 
-    prev_extra_win_date = None
-    if extra_win_cycle is not None:
-        prev_extra_win_date = curr_date
+    rate_schedule = _get_rate_schedule(interest_rate)
+    offset_schedule = _get_offset_schedule(offset)
 
-    schedule = []
-    owing_daily_hist = []
+    if rounding is not None:
+        if rounding not in cent_roundings:
+            raise ValueError("Unsupported rounding: " + str(rounding))
 
-    schedule.append(
-        (
-            curr_date,
-            (curr_date - loan_start).days / 365,
-            relativedelta(curr_date, loan_start),
-            (curr_date - schedule_start).days / 365,
-            relativedelta(curr_date, schedule_start),
-            0,
-            principal,
-            0,
-            0,
-            principal,
-            stash,
-            0,
-            0,
-        )
+        principal = _to_cents(principal)
+        offset = _to_cents(offset_schedule if offset_schedule is not None else offset)
+        offset_schedule = _get_offset_schedule(offset)
+        repayment = _to_cents(repayment)
+        leftover_amount = _to_cents(leftover_amount)
+        leftover_repayment = _to_cents(leftover_repayment)
+        extra_win_amount = _to_cents(extra_win_amount)
+
+    # note: the accrual sums differ with and without rate or offset schedule,
+    #       and with rounding the state is in cents, thus these are part of the timeline
+
+    timeline = (
+        schedule_start,
+        prev_interest_date,
+        interest_cycle,
+        prev_repayment_date,
+        repayment_cycle,
+        extra_win_cycle if extra_win_amount is not None else None,
+        rate_schedule is not None,
+        offset_schedule is not None,
+        rounding,
     )
 
-    while (
-        principal > 0
-        or (leftover_incoming is not None and curr_date <= leftover_incoming)
-        or (extra_win_end is not None and curr_date <= extra_win_end)
-    ):
-        curr_date = curr_date + timedelta(days=1)
+    event_state = None
+    if resume_from is not None:
+        if resume_from.timeline != timeline:
+            raise ValueError("Checkpoint does not match the timeline")
+        event_state = replace(resume_from.events)
+    elif checkpoints is not None:
+        event_state = _EventState()
+
+    events = _iter_events(
+        schedule_start=schedule_start,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        schedule_end=schedule_end,
+        redraw_date=leftover_incoming if leftover_amount is not None else None,
+        extra_win_cycle=extra_win_cycle if extra_win_amount is not None else None,
+        extra_win_end=extra_win_end,
+        state=event_state,
+    )
 
-        maturity_is_today = schedule_end is not None and curr_date >= schedule_end
+    accrual = _Accrual(
+        prev_interest_date, accrual_exact, rate_schedule, offset_schedule
+    )
 
-        curr_interest = None
-        curr_redraw = None
-        curr_repayment = None
-        curr_stashed = None
-        curr_extra_win_for_loan = None
-        curr_extra_win_for_us = None
+    if resume_from is not None:
+        curr_day = resume_from.events.day
+        curr_date = resume_from.date
+        principal = resume_from.principal
+        stash = resume_from.stash
+        (
+            accrual.owing,
+            accrual.owing_days,
+            accrual.days,
+            accrual.prev_day,
+            accrual.prev_date,
+        ) = resume_from.accrual
+    elif rounding is not None:
+        yield curr_day, (0, principal / 100, 0, 0, principal / 100, 0, 0, 0)
+    else:
+        yield curr_day, (0, principal, 0, 0, principal, stash, 0, 0)
 
-        # interest
-        # note: we keep track of the amount owning on a daily basis,
-        #       back to the previous interest calculation
+    next_checkpoint_day = curr_day + (checkpoint_days or 0)
 
-        owing_daily_hist.append(max(0, principal - offset))
+    for event in events:
+        # continuation
+        # note: nothing changes on the days in between events, thus it is sufficient
+        #       to check whether we would still be running on the day before the next event
 
-        if (
-            curr_date >= increment_date(prev_interest_date, interest_cycle)
-            or maturity_is_today
+        if not _is_running(
+            principal, event.date - one_day, leftover_incoming, extra_win_end
         ):
-            curr_interest_date = (
-                increment_date(prev_interest_date, interest_cycle)
-                if not maturity_is_today
-                else curr_date
-            )
+            break
 
-            curr_interest_length = curr_interest_date - prev_interest_date
+        if event.day > max_schedule_days + 1:
+            raise RuntimeError("Repayments did not finish within 100 years")
 
-            curr_interest = (
-                np.mean(owing_daily_hist)
-                * (
-                    (curr_interest_length.days / float(365))
-                    + (curr_interest_length.seconds / float(60 * 60 * 24 * 365))
-                )
-                * (interest_rate / 100)
-            )
+        if offset_schedule is not None:
+            accrual.add(principal, event)
+        else:
+            accrual.add(max(0, principal - offset), event)
+
+        curr_day = event.day
+        curr_date = event.date
 
-            owing_daily_hist = []
+        curr_interest = np.nan
+        curr_redraw = np.nan
+        curr_repayment = np.nan
+        curr_stashed = np.nan
+        curr_extra_win_for_loan = np.nan
+        curr_extra_win_for_us = np.nan
+
+        # interest
+
+        if event.interest_period is not None:
+            curr_interest = accrual.pop_interest(event.interest_period, interest_rate)
+            if rounding is not None:
+                curr_interest = _round_cents(curr_interest, rounding)
 
             principal = principal + curr_interest
-            prev_interest_date = curr_interest_date
 
         # redraw
 
-        if leftover_incoming is not None and leftover_amount is not None:
-            if curr_date >= leftover_incoming:
-                curr_redraw = leftover_amount
-                principal = principal + leftover_amount
-                leftover_amount = None  # making sure the amount is only added once
+        if event.redraw:
+            curr_redraw = leftover_amount
+            principal = principal + leftover_amount
 
         # repayment
 
-        if curr_date >= increment_date(prev_repayment_date, repayment_cycle):
+        if event.repayment:
             actual_repayment = repayment
 
             if leftover_incoming is not None and leftover_repayment is not None:
@@ -210,78 +932,1749 @@ def simulate(
             curr_stashed = stash - prev_stash
 
             principal = principal - curr_repayment
-            prev_repayment_date = increment_date(prev_repayment_date, repayment_cycle)
 
         # extra win
 
-        if prev_extra_win_date is not None and extra_win_amount is not None:
-            if curr_date >= increment_date(prev_extra_win_date, extra_win_cycle) and (
-                extra_win_end is None or curr_date <= extra_win_end
-            ):
-                curr_extra_win_for_loan = min(principal, extra_win_amount)
-                curr_extra_win_for_us = extra_win_amount - curr_extra_win_for_loan
+        if event.extra_win:
+            curr_extra_win_for_loan = min(principal, extra_win_amount)
+            curr_extra_win_for_us = extra_win_amount - curr_extra_win_for_loan
 
-                principal = principal - curr_extra_win_for_loan
-                prev_extra_win_date = increment_date(
-                    prev_extra_win_date, extra_win_cycle
-                )
+            principal = principal - curr_extra_win_for_loan
 
         # data collection
 
-        if (
-            curr_interest is not None
-            or curr_redraw is not None
-            or curr_repayment is not None
-            or curr_stashed is not None
-            or curr_extra_win_for_loan is not None
-            or curr_extra_win_for_us is not None
-            or maturity_is_today is True
-        ):
-            schedule.append(
+        amounts = (
+            curr_interest,
+            curr_redraw,
+            curr_repayment,
+            curr_stashed,
+            principal,
+            stash,
+            curr_extra_win_for_loan,
+            curr_extra_win_for_us,
+        )
+        if rounding is not None:
+            amounts = tuple(amount / 100 for amount in amounts)
+
+        yield curr_day, amounts
+
+        # checkpoint
+
+        if checkpoints is not None and curr_day >= next_checkpoint_day:
+            checkpoints.append(
                 (
                     curr_date,
-                    (curr_date - loan_start).days / 365,
-                    relativedelta(curr_date, loan_start),
-                    (curr_date - schedule_start).days / 365,
-                    relativedelta(curr_date, schedule_start),
-                    curr_interest,
-                    curr_redraw,
-                    curr_repayment,
-                    curr_stashed,
                     principal,
                     stash,
-                    curr_extra_win_for_loan,
-                    curr_extra_win_for_us,
+                    timeline,
+                    replace(event_state),
+                    (
+                        accrual.owing,
+                        accrual.owing_days,
+                        accrual.days,
+                        accrual.prev_day,
+                        accrual.prev_date,
+                    ),
                 )
             )
+            next_checkpoint_day = curr_day + checkpoint_days
 
         # maturity
 
-        if maturity_is_today:
+        if event.maturity:
             break
 
         # safety check
 
-        if curr_date - schedule_start > timedelta(days=100 * 365):
+        if curr_day > max_schedule_days:
             raise RuntimeError("Repayments did not finish within 100 years")
 
-    # return result
 
-    return pd.DataFrame(
-        schedule,
-        columns=[
-            "Date",
-            "LoanYears",
-            "LoanDuration",
-            "ScheduleYears",
-            "ScheduleDuration",
-            "Interest",
-            "Redraw",
-            "Repayment",
-            "Stashed",
-            "Principal",
-            "Stash",
-            "ExtraWinForLoan",
-            "ExtraWinForUs",
-        ],
-    )
+annuity_cycles = [Cycle.FORTNIGHTLY, Cycle.MONTHLY_AVERAGE, Cycle.YEARLY]
+
+
+def _get_annuity_schedule(
+    *,
+    loan_start: pd.Timestamp,
+    principal,
+    offset,
+    schedule_start: pd.Timestamp,
+    interest_rate,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    repayment,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    accrual_exact=False,
+) -> pd.DataFrame | None:
+    # note: with identical interest and repayment cycles of constant length,
+    #       and a single interest rate and offset, the loan is the textbook annuity,
+    #       thus the schedule is computed in closed form by the planner,
+    #       None if the parameters do not reduce to the textbook case
+
+    if (
+        interest_cycle != repayment_cycle
+        or interest_cycle not in annuity_cycles
+        or prev_interest_date != prev_repayment_date
+        or principal <= 0
+        or _get_rate_schedule(interest_rate) is not None
+        or _get_offset_schedule(offset) is not None
+    ):
+        return None
+
+    horizon = schedule_start + (max_schedule_days + 2) * one_day
+    calendar = get_cycle_calendar(prev_interest_date, interest_cycle, horizon)
+    days = calendar.get_days(schedule_start)
+    if days[0] < 1:
+        return None
+
+    dates = schedule_start + pd.to_timedelta(days, unit="D")
+
+    # note: events happen on whole days from schedule_start, with exact accrual,
+    #       the time between a cycle date and its event accrues at the principal before the event,
+    #       thus only cycle dates on whole days are the textbook case
+
+    if accrual_exact and not np.array_equal(dates.to_numpy(), calendar.dates):
+        return None
+
+    k = interest_cycle.per_year()
+    planner = home_loan_planner.HomeLoanPlanner(
+        "Annuity", N=len(days) / k, k=k, P=principal, R0=interest_rate / 100
+    )
+    df = planner.get_amortization_schedule(
+        loan_start=loan_start,
+        schedule_start=schedule_start,
+        c=repayment,
+        offset=offset,
+        dates=dates,
+    )
+
+    if df["Principal"].iat[-1] > 0 or df["Date"].iat[-1] > horizon - 2 * one_day:
+        raise RuntimeError("Repayments did not finish within 100 years")
+
+    return df
+
+
+def simulate(
+    *,
+    loan_start: pd.Timestamp,
+    principal,
+    offset,
+    schedule_start: pd.Timestamp,
+    interest_rate,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    repayment,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    repayment_use_stash,
+    schedule_end: pd.Timestamp | None = None,
+    leftover_incoming: pd.Timestamp | None = None,
+    leftover_amount=None,
+    leftover_repayment=None,
+    extra_win_amount=None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_duration: pd.Timedelta | None = None,
+    accrual_exact=False,
+    rounding=None,
+    resume_from: SimulationCheckpoint | None = None,
+    fast_path=False,
+) -> pd.DataFrame:
+    # note: with fast_path, the textbook case is computed in closed form (see _get_annuity_schedule),
+    #       which is the same as the event driven schedule up to rounding errors (about 1e-10),
+    #       without it, the schedule is always the event driven one, like the ones of
+    #       simulate_with_checkpoints, iter_schedule and simulate_rollups
+
+    if (
+        fast_path
+        and schedule_end is None
+        and leftover_incoming is None
+        and leftover_amount is None
+        and leftover_repayment is None
+        and extra_win_amount is None
+        and extra_win_duration is None
+        and rounding is None
+        and resume_from is None
+    ):
+        df = _get_annuity_schedule(
+            loan_start=loan_start,
+            principal=principal,
+            offset=offset,
+            schedule_start=schedule_start,
+            interest_rate=interest_rate,
+            prev_interest_date=prev_interest_date,
+            interest_cycle=interest_cycle,
+            repayment=repayment,
+            prev_repayment_date=prev_repayment_date,
+            repayment_cycle=repayment_cycle,
+            accrual_exact=accrual_exact,
+        )
+        if df is not None:
+            return df
+
+    schedule = _ScheduleBuffer()
+    if resume_from is not None:
+        schedule.extend(resume_from.days, resume_from.amounts)
+
+    for day, amounts in _iter_rows(
+        principal=principal,
+        offset=offset,
+        schedule_start=schedule_start,
+        interest_rate=interest_rate,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        repayment=repayment,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        repayment_use_stash=repayment_use_stash,
+        schedule_end=schedule_end,
+        leftover_incoming=leftover_incoming,
+        leftover_amount=leftover_amount,
+        leftover_repayment=leftover_repayment,
+        extra_win_amount=extra_win_amount,
+        extra_win_cycle=extra_win_cycle,
+        extra_win_duration=extra_win_duration,
+        accrual_exact=accrual_exact,
+        rounding=rounding,
+        resume_from=resume_from,
+    ):
+        schedule.append(day, amounts)
+
+    return _get_schedule(
+        schedule_start + pd.to_timedelta(schedule.days[: schedule.size], unit="D"),
+        schedule.amounts[:, : schedule.size],
+        loan_start,
+        schedule_start,
+    )
+
+
+def simulate_with_checkpoints(
+    *, checkpoint_interval: pd.Timedelta = pd.Timedelta(days=365), **kwargs
+) -> tuple[pd.DataFrame, list[SimulationCheckpoint]]:
+    # note: takes the same parameters as simulate, but also returns a checkpoint
+    #       after the first event of every checkpoint_interval (see get_checkpoint)
+
+    loan_start = kwargs.pop("loan_start")
+    schedule_start = kwargs["schedule_start"]
+    resume_from = kwargs.get("resume_from")
+
+    schedule = _ScheduleBuffer()
+    if resume_from is not None:
+        schedule.extend(resume_from.days, resume_from.amounts)
+
+    states = []
+    for day, amounts in _iter_rows(
+        **kwargs,
+        checkpoint_days=max(1, pd.Timedelta(checkpoint_interval).days),
+        checkpoints=states,
+    ):
+        schedule.append(day, amounts)
+
+    # note: all checkpoints share one read-only copy of the schedule
+
+    days = schedule.days[: schedule.size].copy()
+    amounts = schedule.amounts[:, : schedule.size].copy()
+    days.flags.writeable = False
+    amounts.flags.writeable = False
+
+    checkpoints = []
+    for date, principal, stash, timeline, events, accrual in states:
+        rows = int(np.searchsorted(days, events.day, side="right"))
+        checkpoints.append(
+            SimulationCheckpoint(
+                date=date,
+                principal=principal,
+                stash=stash,
+                timeline=timeline,
+                events=events,
+                accrual=accrual,
+                days=days[:rows],
+                amounts=amounts[:, :rows],
+            )
+        )
+
+    df = _get_schedule(
+        schedule_start + pd.to_timedelta(days, unit="D"),
+        amounts.copy(),
+        loan_start,
+        schedule_start,
+    )
+
+    return df, checkpoints
+
+
+@dataclass
+class ScheduleRollups:
+    month: pd.DataFrame
+    financial_year: pd.DataFrame
+    loan_year: pd.DataFrame
+    schedule: pd.DataFrame | None = None
+
+
+rollup_sum_columns = [
+    "Interest",
+    "Redraw",
+    "Repayment",
+    "ExtraWinForLoan",
+    "ExtraWinForUs",
+]
+rollup_end_columns = ["Principal", "Stash"]
+
+
+def _get_period_starts(
+    first_date: pd.Timestamp, last_date: pd.Timestamp, anchor: pd.Timestamp, months
+) -> pd.DatetimeIndex:
+    # note: the starts of all periods of months length (counted from anchor) from the one
+    #       containing first_date up to the one containing last_date
+
+    offset = (first_date.year - anchor.year) * 12 + first_date.month - anchor.month
+    index = offset // months - 1
+
+    starts = []
+    while True:
+        start = anchor + relativedelta(months=index * months)
+        if start > last_date:
+            break
+        starts.append(start)
+        index = index + 1
+
+    return pd.DatetimeIndex(starts)
+
+
+def _get_rollup(
+    dates: pd.DatetimeIndex, amounts: np.ndarray, starts: pd.DatetimeIndex
+) -> pd.DataFrame:
+    # note: rows are assigned to periods by binary search, and summed per period in one pass
+
+    period_index = starts.searchsorted(dates, side="right") - 1
+    first_rows = np.flatnonzero(np.diff(period_index, prepend=-1))
+    last_rows = np.append(first_rows[1:], len(dates)) - 1
+
+    columns = {"Start": starts[period_index[first_rows]]}
+    for column in rollup_sum_columns:
+        values = np.nan_to_num(amounts[amount_columns.index(column)])
+        columns[column] = np.add.reduceat(values, first_rows)
+    for column in rollup_end_columns:
+        columns[column] = amounts[amount_columns.index(column)][last_rows]
+
+    return pd.DataFrame(columns)
+
+
+def simulate_rollups(
+    *, include_schedule=False, financial_year_start_month=7, **kwargs
+) -> ScheduleRollups:
+    # note: takes the same parameters as simulate, but returns the sums per calendar month,
+    #       financial year (by default from July) and loan year (from the anniversary of loan_start),
+    #       principal and stash are the ones at the end of each period,
+    #       the rollups are computed from the engine's columns, without building the schedule,
+    #       which is only included on request
+
+    loan_start = kwargs.pop("loan_start")
+    schedule_start = kwargs["schedule_start"]
+
+    schedule = _ScheduleBuffer()
+    for day, amounts in _iter_rows(**kwargs):
+        schedule.append(day, amounts)
+
+    dates = schedule_start + pd.to_timedelta(schedule.days[: schedule.size], unit="D")
+    amounts = schedule.amounts[:, : schedule.size]
+
+    first_date, last_date = dates[0], dates[-1]
+    month_anchor = pd.Timestamp(first_date.year, 1, 1)
+    financial_year_anchor = pd.Timestamp(first_date.year, financial_year_start_month, 1)
+
+    return ScheduleRollups(
+        month=_get_rollup(
+            dates, amounts, _get_period_starts(first_date, last_date, month_anchor, 1)
+        ),
+        financial_year=_get_rollup(
+            dates,
+            amounts,
+            _get_period_starts(first_date, last_date, financial_year_anchor, 12),
+        ),
+        loan_year=_get_rollup(
+            dates,
+            amounts,
+            _get_period_starts(first_date, last_date, loan_start, 12),
+        ),
+        schedule=(
+            _get_schedule(dates, amounts, loan_start, schedule_start)
+            if include_schedule
+            else None
+        ),
+    )
+
+
+class ScheduleRow(NamedTuple):
+    Date: pd.Timestamp
+    LoanYears: float
+    ScheduleYears: float
+    Interest: float
+    Redraw: float
+    Repayment: float
+    Stashed: float
+    Principal: float
+    Stash: float
+    ExtraWinForLoan: float
+    ExtraWinForUs: float
+
+
+def iter_schedule(*, chunk_size=None, **kwargs):
+    # note: takes the same parameters as simulate (except fast_path), but yields the schedule
+    #       while it is simulated, either row by row (as ScheduleRow), or with chunk_size,
+    #       as schedules of up to chunk_size rows, which concatenated are the same as
+    #       the result of simulate without fast_path
+
+    loan_start = kwargs.pop("loan_start")
+    schedule_start = kwargs["schedule_start"]
+
+    if chunk_size is None:
+        for day, amounts in _iter_rows(**kwargs):
+            date = schedule_start + day * one_day
+            yield ScheduleRow(
+                date,
+                (date - loan_start).days / 365,
+                (date - schedule_start).days / 365,
+                *amounts,
+            )
+        return
+
+    rows = 0
+    schedule = _ScheduleBuffer(chunk_size)
+
+    for day, amounts in _iter_rows(**kwargs):
+        schedule.append(day, amounts)
+
+        if schedule.size == chunk_size:
+            yield _get_chunk(schedule, rows, loan_start, schedule_start)
+            rows = rows + schedule.size
+            schedule = _ScheduleBuffer(chunk_size)
+
+    if schedule.size > 0:
+        yield _get_chunk(schedule, rows, loan_start, schedule_start)
+
+
+def _get_chunk(
+    schedule: _ScheduleBuffer,
+    rows,
+    loan_start: pd.Timestamp,
+    schedule_start: pd.Timestamp,
+) -> pd.DataFrame:
+    df = _get_schedule(
+        schedule_start + pd.to_timedelta(schedule.days[: schedule.size], unit="D"),
+        schedule.amounts[:, : schedule.size],
+        loan_start,
+        schedule_start,
+    )
+    df.index = pd.RangeIndex(rows, rows + schedule.size)
+    return df
+
+
+@dataclass
+class SimulationSummary:
+    end_date: pd.Timestamp
+    loan_years: float
+    schedule_years: float
+    total_interest: float
+    total_repayment: float
+    total_extra_win_for_loan: float
+    total_extra_win_for_us: float
+    principal: float
+    stash: float
+
+
+def simulate_summary(**kwargs) -> SimulationSummary:
+    # note: takes the same parameters as simulate, but only keeps running totals,
+    #       i.e. the totals are the sums of the respective columns of the schedule,
+    #       principal and stash are the ones at the end of the schedule
+
+    loan_start = kwargs.pop("loan_start")
+    schedule_start = kwargs["schedule_start"]
+
+    last_day = 0
+    total_interest = 0
+    total_repayment = 0
+    total_extra_win_for_loan = 0
+    total_extra_win_for_us = 0
+
+    resume_from = kwargs.get("resume_from")
+    if resume_from is not None:
+        # note: the totals up to the checkpoint are taken from its schedule
+
+        last_day = resume_from.events.day
+        principal = resume_from.principal
+        stash = resume_from.stash
+
+        totals = np.nansum(resume_from.amounts, axis=1)
+        total_interest = float(totals[amount_columns.index("Interest")])
+        total_repayment = float(totals[amount_columns.index("Repayment")])
+        total_extra_win_for_loan = float(
+            totals[amount_columns.index("ExtraWinForLoan")]
+        )
+        total_extra_win_for_us = float(totals[amount_columns.index("ExtraWinForUs")])
+
+    for last_day, amounts in _iter_rows(**kwargs):
+        (
+            curr_interest,
+            _,
+            curr_repayment,
+            _,
+            principal,
+            stash,
+            curr_extra_win_for_loan,
+            curr_extra_win_for_us,
+        ) = amounts
+
+        # note: NaN means there was no such event on that day
+
+        if not math.isnan(curr_interest):
+            total_interest = total_interest + curr_interest
+        if not math.isnan(curr_repayment):
+            total_repayment = total_repayment + curr_repayment
+        if not math.isnan(curr_extra_win_for_loan):
+            total_extra_win_for_loan = (
+                total_extra_win_for_loan + curr_extra_win_for_loan
+            )
+            total_extra_win_for_us = total_extra_win_for_us + curr_extra_win_for_us
+
+    end_date = schedule_start + last_day * one_day
+
+    return SimulationSummary(
+        end_date=end_date,
+        loan_years=(end_date - loan_start).days / 365,
+        schedule_years=(end_date - schedule_start).days / 365,
+        total_interest=total_interest,
+        total_repayment=total_repayment,
+        total_extra_win_for_loan=total_extra_win_for_loan,
+        total_extra_win_for_us=total_extra_win_for_us,
+        principal=principal,
+        stash=stash,
+    )
+
+
+def _get_repayment_estimate(
+    *,
+    principal,
+    offset,
+    interest_rate,
+    repayment_cycle: Cycle,
+    years=None,
+    total_interest=None,
+):
+    # note: closed-form estimate for identical repayment and interest cycles,
+    #       either for a given term, or for the term with the given total interest,
+    #       the offset is taken into account by reducing the interest rate accordingly
+
+    k = repayment_cycle.per_year()
+    p = max(principal, 1)
+    r = interest_rate / 100 / k * max(0, principal - offset) / p
+
+    def get_repayment(n):
+        return home_loan_planner.HomeLoanPlanner.get_recurring_payment_c(n=n, p=p, r=r)
+
+    if total_interest is not None:
+        # note: total interest of the annuity (n * c - p) grows with the term n
+
+        n_low, n_high = 1, 100 * k
+        for _ in range(50):
+            n = (n_low + n_high) / 2
+            if n * get_repayment(n) - p > total_interest:
+                n_high = n
+            else:
+                n_low = n
+        return get_repayment(n_high)
+
+    return get_repayment(max(years * k, 1))
+
+
+def solve_repayment(
+    *,
+    target_end_date: pd.Timestamp | None = None,
+    target_total_interest=None,
+    tolerance=0.01,
+    max_evaluations=50,
+    **kwargs,
+) -> float:
+    # note: takes the same parameters as simulate, except for repayment, which is solved for,
+    #       i.e. the smallest repayment (within tolerance) that finishes by target_end_date,
+    #       or that keeps the total interest at or below target_total_interest,
+    #       an extra repayment is the result minus the base repayment
+
+    if (target_end_date is None) == (target_total_interest is None):
+        raise ValueError("Exactly one target needs to be given")
+    if target_end_date is not None and kwargs.get("schedule_end") is not None:
+        raise ValueError("Target end date cannot be combined with schedule end")
+
+    evaluations = 0
+
+    if target_end_date is not None:
+        schedule_start = kwargs["schedule_start"]
+        target_day = _days_until(schedule_start, target_end_date)
+        repayment_days = get_cycle_calendar(
+            kwargs["prev_repayment_date"],
+            kwargs["repayment_cycle"],
+            schedule_start + target_day * one_day,
+        ).get_days(schedule_start)
+
+    def get_excess(repayment):
+        # note: positive if the repayment is too small, (almost) continuous in the repayment,
+        #       i.e. what is left owing at the target date (less the stash),
+        #       or if finished earlier, minus the repayments that would still be due until then,
+        #       or the total interest beyond the target
+
+        nonlocal evaluations
+        if evaluations >= max_evaluations:
+            raise RuntimeError("Repayment did not converge")
+        evaluations = evaluations + 1
+
+        try:
+            if target_end_date is not None:
+                # note: stopping the day after the target day, as a maturity
+                #       on the target day would add interest for that very day
+
+                summary = simulate_summary(
+                    **kwargs,
+                    repayment=repayment,
+                    schedule_end=schedule_start + (target_day + 1) * one_day,
+                )
+                if summary.principal > 0:
+                    return summary.principal - summary.stash
+                repayments_early = bisect.bisect_right(
+                    repayment_days, target_day
+                ) - bisect.bisect_right(
+                    repayment_days, _days_until(schedule_start, summary.end_date)
+                )
+                return -summary.stash - repayment * repayments_early
+            summary = simulate_summary(**kwargs, repayment=repayment)
+            return summary.total_interest - target_total_interest
+        except RuntimeError:
+            return math.inf
+
+    # bracket, starting from the closed-form estimate
+    # note: with a rate or offset schedule, the estimate is based on the value at the start
+
+    rate_schedule = _get_rate_schedule(kwargs["interest_rate"])
+    offset_schedule = _get_offset_schedule(kwargs["offset"])
+
+    estimate = _get_repayment_estimate(
+        principal=kwargs["principal"],
+        offset=(
+            offset_schedule.get_value(kwargs["schedule_start"])
+            if offset_schedule is not None
+            else kwargs["offset"]
+        ),
+        interest_rate=(
+            rate_schedule.get_value(kwargs["schedule_start"])
+            if rate_schedule is not None
+            else kwargs["interest_rate"]
+        ),
+        repayment_cycle=kwargs["repayment_cycle"],
+        years=(
+            (target_end_date - kwargs["schedule_start"]).days / 365
+            if target_end_date is not None
+            else None
+        ),
+        total_interest=target_total_interest,
+    )
+
+    low, high = 0.95 * estimate, 1.05 * estimate
+    excess_low, excess_high = get_excess(low), get_excess(high)
+
+    while excess_low <= 0:
+        high, excess_high = low, excess_low
+        low = low / 2
+        excess_low = get_excess(low)
+
+    while excess_high > 0:
+        low, excess_low = high, excess_high
+        high = high * 2
+        excess_high = get_excess(high)
+
+    # refine, using regula falsi (Illinois variant),
+    # note: falls back to bisection as long as the lower end does not finish at all
+
+    side = 0
+    while high - low > tolerance:
+        if math.isinf(excess_low):
+            repayment = (low + high) / 2
+        else:
+            repayment = high - excess_high * (high - low) / (excess_high - excess_low)
+            repayment = min(max(repayment, low + tolerance / 2), high - tolerance / 2)
+
+        excess = get_excess(repayment)
+
+        if excess > 0:
+            low, excess_low = repayment, excess
+            if side == -1:
+                excess_high = excess_high / 2
+            side = -1
+        else:
+            high, excess_high = repayment, excess
+            if side == 1 and not math.isinf(excess_low):
+                excess_low = excess_low / 2
+            side = 1
+
+    return high
+
+
+def _get_scenario_values(values) -> np.ndarray:
+    values = np.atleast_1d(np.asarray(values, dtype=object))
+    values[pd.isna(values)] = np.nan
+    return values.astype(float)
+
+
+def _iter_batch_rows(
+    *,
+    principal,
+    offset,
+    schedule_start: pd.Timestamp,
+    interest_rate,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    repayment,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    repayment_use_stash,
+    schedule_end: pd.Timestamp | None = None,
+    leftover_incoming: pd.Timestamp | None = None,
+    leftover_amount=None,
+    leftover_repayment=None,
+    extra_win_amount=None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_duration: pd.Timedelta | None = None,
+    accrual_exact=False,
+    rounding=None,
+    stop_at_horizon=False,
+):
+    # note: same as _iter_rows, but for arrays of scenarios, each row is yielded as
+    #       (day, scenarios with data on that day, amounts of all scenarios),
+    #       interest_rate can also be a function, which is called with each interest period
+    #       and returns the interest rates of all scenarios for that period,
+    #       with rounding, amounts are kept as whole cents in float arrays (exact up to 2**53 cents),
+    #       with stop_at_horizon, scenarios still running after 100 years are stopped there
+    #       instead of raising, they keep their last principal
+
+    interest_rate_function = interest_rate if callable(interest_rate) else None
+
+    (
+        principal,
+        offset,
+        interest_rate,
+        repayment,
+        leftover_amount,
+        leftover_repayment,
+        extra_win_amount,
+    ) = [
+        np.array(item, dtype=float)
+        for item in np.broadcast_arrays(
+            *[
+                _get_scenario_values(item)
+                for item in (
+                    principal,
+                    offset,
+                    interest_rate if interest_rate_function is None else np.nan,
+                    repayment,
+                    leftover_amount,
+                    leftover_repayment,
+                    extra_win_amount,
+                )
+            ]
+        )
+    ]
+
+    if principal.ndim != 1:
+        raise ValueError("Scenario parameters need to be one-dimensional")
+
+    if rounding is not None:
+        if rounding not in cent_roundings:
+            raise ValueError("Unsupported rounding: " + str(rounding))
+
+        principal = _to_cents(principal)
+        offset = _to_cents(offset)
+        repayment = _to_cents(repayment)
+        leftover_amount = _to_cents(leftover_amount)
+        leftover_repayment = _to_cents(leftover_repayment)
+        extra_win_amount = _to_cents(extra_win_amount)
+
+    scenarios = np.arange(len(principal))
+
+    has_redraw = ~np.isnan(leftover_amount)
+    has_leftover_repayment = ~np.isnan(leftover_repayment)
+    has_extra_win = ~np.isnan(extra_win_amount)
+
+    stash = np.zeros(len(scenarios))
+    active = np.ones(len(scenarios), dtype=bool)
+
+    # note: extra_win_duration is per scenario as well (None or NaT meaning None),
+    #       it extends the continuation of its scenario only, and the extra win events
+    #       last until the latest end, unless a scenario with extra win has no end
+
+    extra_win_ends = (
+        schedule_start
+        + pd.to_timedelta(
+            np.broadcast_to(
+                np.array(
+                    extra_win_duration if extra_win_duration is not None else pd.NaT,
+                    dtype=object,
+                ),
+                principal.shape,
+            )
+        )
+    ).to_numpy()
+    has_extra_win_end = ~np.isnat(extra_win_ends)
+
+    if has_extra_win.any() and has_extra_win_end[has_extra_win].all():
+        extra_win_end = pd.Timestamp(extra_win_ends[has_extra_win].max())
+    else:
+        extra_win_end = None
+
+    events = _iter_events(
+        schedule_start=schedule_start,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        schedule_end=schedule_end,
+        redraw_date=leftover_incoming if has_redraw.any() else None,
+        extra_win_cycle=extra_win_cycle if has_extra_win.any() else None,
+        extra_win_end=extra_win_end,
+    )
+
+    accrual = _Accrual(prev_interest_date, accrual_exact)
+
+    curr_day = 0
+
+    nothing = np.zeros(len(scenarios))
+    yield curr_day, active, (
+        nothing,
+        principal if rounding is None else principal / 100,
+        nothing,
+        nothing,
+        principal if rounding is None else principal / 100,
+        stash,
+        nothing,
+        nothing,
+    )
+
+    for event in events:
+        # continuation
+
+        active = active & (
+            _is_running(principal, event.date - one_day, leftover_incoming, None)
+            | (extra_win_ends >= (event.date - one_day).to_datetime64())
+        )
+
+        if not active.any():
+            break
+
+        if event.day > max_schedule_days + 1:
+            if stop_at_horizon:
+                break
+            raise RuntimeError("Repayments did not finish within 100 years")
+
+        accrual.add(np.maximum(0, principal - offset), event)
+
+        curr_day = event.day
+        curr_date = event.date
+
+        nothing = np.full(len(scenarios), np.nan)
+
+        curr_interest = nothing
+        curr_redraw = nothing
+        curr_repayment = nothing
+        curr_stashed = nothing
+        curr_extra_win_for_loan = nothing
+        curr_extra_win_for_us = nothing
+
+        # interest
+
+        if event.interest_period is not None:
+            if interest_rate_function is not None:
+                interest_rate = interest_rate_function(event.interest_period)
+
+            curr_interest = accrual.pop_interest(event.interest_period, interest_rate)
+            if rounding is not None:
+                curr_interest = _round_cents(curr_interest, rounding)
+
+            principal = principal + curr_interest
+
+        # redraw
+
+        if event.redraw:
+            curr_redraw = leftover_amount
+            principal = np.where(has_redraw, principal + leftover_amount, principal)
+
+        # repayment
+
+        if event.repayment:
+            actual_repayment = repayment
+
+            if leftover_incoming is not None and curr_date >= leftover_incoming:
+                actual_repayment = np.where(
+                    has_leftover_repayment,
+                    actual_repayment + leftover_repayment,
+                    actual_repayment,
+                )
+
+            prev_stash = stash
+            if repayment_use_stash:
+                actual_repayment = actual_repayment + stash
+                stash = np.zeros(len(scenarios))
+
+            curr_repayment = np.minimum(principal, actual_repayment)
+
+            stash = stash + actual_repayment - curr_repayment
+            curr_stashed = stash - prev_stash
+
+            principal = principal - curr_repayment
+
+        # extra win
+
+        extra_win_today = (
+            event.extra_win
+            & has_extra_win
+            & (~has_extra_win_end | (extra_win_ends >= curr_date.to_datetime64()))
+        )
+
+        if extra_win_today.any():
+            curr_extra_win_for_loan = np.where(
+                extra_win_today, np.minimum(principal, extra_win_amount), np.nan
+            )
+            curr_extra_win_for_us = extra_win_amount - curr_extra_win_for_loan
+
+            principal = np.where(
+                extra_win_today, principal - curr_extra_win_for_loan, principal
+            )
+
+        # data collection
+        # note: a scenario without redraw or extra win has no data on such an event
+
+        has_data = active & (
+            (event.interest_period is not None or event.repayment or event.maturity)
+            | (event.redraw & has_redraw)
+            | extra_win_today
+        )
+
+        amounts = (
+            curr_interest,
+            curr_redraw,
+            curr_repayment,
+            curr_stashed,
+            principal,
+            stash,
+            curr_extra_win_for_loan,
+            curr_extra_win_for_us,
+        )
+        if rounding is not None:
+            amounts = tuple(amount / 100 for amount in amounts)
+
+        yield curr_day, has_data, amounts
+
+        # maturity
+
+        if event.maturity:
+            break
+
+        # safety check
+
+        if curr_day > max_schedule_days:
+            if stop_at_horizon:
+                break
+            raise RuntimeError("Repayments did not finish within 100 years")
+
+
+def simulate_batch(
+    *,
+    loan_start: pd.Timestamp,
+    principal,
+    offset,
+    schedule_start: pd.Timestamp,
+    interest_rate,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    repayment,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    repayment_use_stash,
+    schedule_end: pd.Timestamp | None = None,
+    leftover_incoming: pd.Timestamp | None = None,
+    leftover_amount=None,
+    leftover_repayment=None,
+    extra_win_amount=None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_duration: pd.Timedelta | None = None,
+    accrual_exact=False,
+    rounding=None,
+) -> pd.DataFrame:
+    # note: same as simulate, but principal, offset, interest_rate, repayment, leftover_amount,
+    #       leftover_repayment, extra_win_amount and extra_win_duration can be arrays,
+    #       one entry per scenario (NaN or NaT meaning None),
+    #       all scenarios share the dates and are advanced together,
+    #       the result is the schedules of all scenarios, tagged by the column Scenario
+
+    # note: columns are collected per event, for the scenarios with data on that event
+
+    days = []
+    day_indexes = []
+    scenarios = []
+    amounts = [[] for _ in amount_columns]
+
+    for day, has_data, curr_amounts in _iter_batch_rows(
+        principal=principal,
+        offset=offset,
+        schedule_start=schedule_start,
+        interest_rate=interest_rate,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        repayment=repayment,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        repayment_use_stash=repayment_use_stash,
+        schedule_end=schedule_end,
+        leftover_incoming=leftover_incoming,
+        leftover_amount=leftover_amount,
+        leftover_repayment=leftover_repayment,
+        extra_win_amount=extra_win_amount,
+        extra_win_cycle=extra_win_cycle,
+        extra_win_duration=extra_win_duration,
+        accrual_exact=accrual_exact,
+        rounding=rounding,
+    ):
+        curr_scenarios = np.flatnonzero(has_data)
+        days.append(day)
+        day_indexes.append(np.full(len(curr_scenarios), len(days) - 1))
+        scenarios.append(curr_scenarios)
+        for column, amount in zip(amounts, curr_amounts):
+            column.append(amount[curr_scenarios])
+
+    # return result
+
+    dates = schedule_start + pd.to_timedelta(days, unit="D")
+    day_indexes = np.concatenate(day_indexes)
+    scenarios = np.concatenate(scenarios)
+    amounts = [np.concatenate(column) for column in amounts]
+
+    order = np.argsort(scenarios, kind="stable")
+
+    return _get_schedule(
+        dates[day_indexes[order]],
+        [amount[order] for amount in amounts],
+        loan_start,
+        schedule_start,
+        extra_columns={"Scenario": scenarios[order]},
+    )
+
+
+class _RatePaths:
+    # note: mean reverting (Ornstein-Uhlenbeck / Vasicek) interest rates, one per path,
+    #       the rate of each interest period is the rate at its start, the rates are then
+    #       advanced exactly over the period, so the result does not depend on the cycle
+
+    def __init__(
+        self,
+        *,
+        interest_rate,
+        paths,
+        mean_interest_rate,
+        reversion,
+        volatility,
+        min_interest_rate,
+        percentiles,
+        seed,
+    ):
+        self.rates = np.full(paths, float(interest_rate))
+        self.mean_interest_rate = float(mean_interest_rate)
+        self.reversion = float(reversion)
+        self.volatility = float(volatility)
+        self.min_interest_rate = float(min_interest_rate)
+        self.percentiles = percentiles
+        self.rng = np.random.default_rng(seed)
+        self.dates = []
+        self.bands = []
+
+    def __call__(self, interest_period):
+        curr_rates = np.maximum(self.min_interest_rate, self.rates)
+        self.dates.append(interest_period[1])
+        self.bands.append(np.percentile(curr_rates, self.percentiles))
+
+        years = _get_interest_years(interest_period)
+        decay = math.exp(-self.reversion * years)
+        if self.reversion > 0:
+            spread = self.volatility * math.sqrt((1 - decay**2) / (2 * self.reversion))
+        else:
+            spread = self.volatility * math.sqrt(years)
+
+        self.rates = (
+            self.mean_interest_rate
+            + (self.rates - self.mean_interest_rate) * decay
+            + spread * self.rng.standard_normal(len(self.rates))
+        )
+
+        return curr_rates
+
+
+@dataclass
+class RatePathBands:
+    principal: pd.DataFrame
+    interest_rate: pd.DataFrame
+    end_date: pd.Series
+
+
+def simulate_rate_paths(
+    *,
+    interest_rate,
+    paths=1000,
+    mean_interest_rate=None,
+    reversion=0.5,
+    volatility=1.0,
+    min_interest_rate=0.0,
+    percentiles=(5, 25, 50, 75, 95),
+    seed=None,
+    **kwargs,
+) -> RatePathBands:
+    # note: takes the same parameters as simulate_batch (except loan_start), but the interest rate
+    #       follows a random path per scenario, starting at interest_rate and reverting to
+    #       mean_interest_rate (by default interest_rate), volatility is in percentage points
+    #       per square root of a year, all paths are simulated together, only the percentile bands
+    #       (over all paths) of principal, interest rate and end date are kept
+
+    kwargs.pop("loan_start", None)
+    kwargs["principal"] = np.broadcast_to(
+        _get_scenario_values(kwargs["principal"]), paths
+    )
+
+    rate_paths = _RatePaths(
+        interest_rate=interest_rate,
+        paths=paths,
+        mean_interest_rate=(
+            interest_rate if mean_interest_rate is None else mean_interest_rate
+        ),
+        reversion=reversion,
+        volatility=volatility,
+        min_interest_rate=min_interest_rate,
+        percentiles=percentiles,
+        seed=seed,
+    )
+
+    # note: paid off paths keep a principal of 0, so they are included in the bands,
+    #       paths not paid off (or matured) within 100 years are stopped there and count
+    #       as never repaid (an end day of infinity, which is an end date of NaT in the bands)
+
+    days = []
+    principal_bands = []
+    end_days = np.zeros(paths)
+    principal = np.zeros(paths)
+
+    for day, has_data, amounts in _iter_batch_rows(
+        interest_rate=rate_paths, stop_at_horizon=True, **kwargs
+    ):
+        if not has_data.any():
+            continue
+
+        principal = amounts[amount_columns.index("Principal")]
+        days.append(day)
+        principal_bands.append(np.percentile(principal, percentiles))
+        end_days[has_data] = day
+
+    schedule_end = kwargs.get("schedule_end")
+    if schedule_end is None or days[-1] < _days_until(
+        kwargs["schedule_start"], schedule_end
+    ):
+        end_days[principal > 0] = np.inf
+
+    # return result
+
+    schedule_start = kwargs["schedule_start"]
+    columns = [f"P{percentile:g}" for percentile in percentiles]
+
+    principal = pd.DataFrame(np.array(principal_bands), columns=columns)
+    principal.insert(0, "Date", schedule_start + pd.to_timedelta(days, unit="D"))
+
+    rates = pd.DataFrame(
+        np.array(rate_paths.bands).reshape(-1, len(columns)), columns=columns
+    )
+    rates.insert(0, "Date", pd.DatetimeIndex(rate_paths.dates))
+
+    end_days = np.percentile(end_days, percentiles, method="nearest")
+    end_date = pd.Series(
+        schedule_start
+        + pd.to_timedelta(np.where(np.isinf(end_days), np.nan, end_days), unit="D"),
+        index=columns,
+    )
+
+    return RatePathBands(principal=principal, interest_rate=rates, end_date=end_date)
+
+
+def _iter_split_rows(
+    *,
+    schedule_start: pd.Timestamp,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    repayment_use_stash,
+    fixed_principal,
+    fixed_interest_rate,
+    fixed_repayment,
+    fixed_end: pd.Timestamp,
+    variable_principal,
+    variable_interest_rate,
+    variable_repayment,
+    offset,
+    schedule_end: pd.Timestamp | None = None,
+    extra_win_amount=None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_duration: pd.Timedelta | None = None,
+    accrual_exact=False,
+):
+    # note: same as _iter_rows, but for a fixed and a variable loan advanced together,
+    #       at the end of the fixed term, the fixed loan matures and its principal is
+    #       redrawn from the variable loan, which from then on also gets the fixed repayment,
+    #       the offset and extra wins only apply to the variable loan,
+    #       each row is yielded as (day, account, amounts), with account 0 (fixed) or 1 (variable)
+
+    fixed_stash = 0
+    variable_stash = 0
+
+    if extra_win_duration is not None:
+        extra_win_end = schedule_start + extra_win_duration
+    else:
+        extra_win_end = None
+
+    events = _iter_events(
+        schedule_start=schedule_start,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        schedule_end=schedule_end,
+        redraw_date=fixed_end,
+        extra_win_cycle=extra_win_cycle if extra_win_amount is not None else None,
+        extra_win_end=extra_win_end,
+    )
+
+    # note: the fixed loan matures on the day of the redraw,
+    #       with the interest calculated up to the end of the fixed term
+
+    fixed_maturity_day = max(1, _days_until(schedule_start, fixed_end))
+    fixed_prev_interest_date = prev_interest_date
+    fixed_running = True
+
+    offset_schedule = _get_offset_schedule(offset)
+
+    fixed_accrual = _Accrual(
+        prev_interest_date, accrual_exact, _get_rate_schedule(fixed_interest_rate)
+    )
+    variable_accrual = _Accrual(
+        prev_interest_date,
+        accrual_exact,
+        _get_rate_schedule(variable_interest_rate),
+        offset_schedule,
+    )
+
+    yield 0, 0, (0, fixed_principal, 0, 0, fixed_principal, fixed_stash, 0, 0)
+    yield 0, 1, (
+        0,
+        variable_principal,
+        0,
+        0,
+        variable_principal,
+        variable_stash,
+        0,
+        0,
+    )
+
+    for event in events:
+        # continuation
+
+        fixed_running = fixed_running and fixed_principal > 0
+        variable_running = _is_running(
+            variable_principal, event.date - one_day, fixed_end, extra_win_end
+        )
+
+        if not (fixed_running or variable_running):
+            break
+
+        if event.day > max_schedule_days + 1:
+            raise RuntimeError("Repayments did not finish within 100 years")
+
+        curr_day = event.day
+        curr_date = event.date
+
+        # fixed loan
+        # note: same as _iter_rows, without offset, redraw and extra wins
+
+        fixed_maturity = curr_day >= fixed_maturity_day
+        if fixed_running and (
+            event.interest_period is not None or event.repayment or fixed_maturity
+        ):
+            fixed_accrual.add(fixed_principal, event)
+
+            curr_interest = np.nan
+            curr_repayment = np.nan
+            curr_stashed = np.nan
+
+            if event.interest_period is not None or fixed_maturity:
+                interest_period = (
+                    (fixed_prev_interest_date, curr_date)
+                    if fixed_maturity
+                    else event.interest_period
+                )
+                fixed_prev_interest_date = interest_period[1]
+
+                curr_interest = fixed_accrual.pop_interest(
+                    interest_period, fixed_interest_rate
+                )
+                fixed_principal = fixed_principal + curr_interest
+
+            if event.repayment:
+                actual_repayment = fixed_repayment
+
+                prev_stash = fixed_stash
+                if repayment_use_stash:
+                    actual_repayment = actual_repayment + fixed_stash
+                    fixed_stash = 0
+
+                curr_repayment = min(fixed_principal, actual_repayment)
+
+                fixed_stash = fixed_stash + actual_repayment - curr_repayment
+                curr_stashed = fixed_stash - prev_stash
+
+                fixed_principal = fixed_principal - curr_repayment
+
+            yield curr_day, 0, (
+                curr_interest,
+                np.nan,
+                curr_repayment,
+                curr_stashed,
+                fixed_principal,
+                fixed_stash,
+                np.nan,
+                np.nan,
+            )
+
+            fixed_running = not fixed_maturity
+
+        # variable loan
+        # note: same as _iter_rows, with the fixed loan as the leftover
+
+        if variable_running:
+            if offset_schedule is not None:
+                variable_accrual.add(variable_principal, event)
+            else:
+                variable_accrual.add(max(0, variable_principal - offset), event)
+
+            curr_interest = np.nan
+            curr_redraw = np.nan
+            curr_repayment = np.nan
+            curr_stashed = np.nan
+            curr_extra_win_for_loan = np.nan
+            curr_extra_win_for_us = np.nan
+
+            if event.interest_period is not None:
+                curr_interest = variable_accrual.pop_interest(
+                    event.interest_period, variable_interest_rate
+                )
+                variable_principal = variable_principal + curr_interest
+
+            if event.redraw:
+                curr_redraw = fixed_principal
+                variable_principal = variable_principal + fixed_principal
+
+            if event.repayment:
+                actual_repayment = variable_repayment
+                if curr_date >= fixed_end:
+                    actual_repayment = actual_repayment + fixed_repayment
+
+                prev_stash = variable_stash
+                if repayment_use_stash:
+                    actual_repayment = actual_repayment + variable_stash
+                    variable_stash = 0
+
+                curr_repayment = min(variable_principal, actual_repayment)
+
+                variable_stash = variable_stash + actual_repayment - curr_repayment
+                curr_stashed = variable_stash - prev_stash
+
+                variable_principal = variable_principal - curr_repayment
+
+            if event.extra_win:
+                curr_extra_win_for_loan = min(variable_principal, extra_win_amount)
+                curr_extra_win_for_us = extra_win_amount - curr_extra_win_for_loan
+
+                variable_principal = variable_principal - curr_extra_win_for_loan
+
+            yield curr_day, 1, (
+                curr_interest,
+                curr_redraw,
+                curr_repayment,
+                curr_stashed,
+                variable_principal,
+                variable_stash,
+                curr_extra_win_for_loan,
+                curr_extra_win_for_us,
+            )
+
+        # maturity
+
+        if event.maturity:
+            break
+
+        # safety check
+
+        if curr_day > max_schedule_days:
+            raise RuntimeError("Repayments did not finish within 100 years")
+
+
+split_loan_accounts = ["Fixed", "Variable"]
+
+
+def simulate_split_loan(
+    *,
+    loan_start: pd.Timestamp,
+    schedule_start: pd.Timestamp,
+    prev_interest_date: pd.Timestamp,
+    interest_cycle: Cycle,
+    prev_repayment_date: pd.Timestamp,
+    repayment_cycle: Cycle,
+    repayment_use_stash,
+    fixed_principal,
+    fixed_interest_rate,
+    fixed_repayment,
+    fixed_end: pd.Timestamp,
+    variable_principal,
+    variable_interest_rate,
+    variable_repayment,
+    offset,
+    schedule_end: pd.Timestamp | None = None,
+    extra_win_amount=None,
+    extra_win_cycle: Cycle | None = None,
+    extra_win_duration: pd.Timedelta | None = None,
+    accrual_exact=False,
+) -> pd.DataFrame:
+    # note: same as simulating the fixed loan up to fixed_end, and then the variable loan
+    #       with the fixed loan's final principal and repayment as leftover, in a single pass,
+    #       the result is the schedules of both loans, tagged by the column Account
+
+    schedules = [_ScheduleBuffer(), _ScheduleBuffer()]
+
+    for day, account, amounts in _iter_split_rows(
+        schedule_start=schedule_start,
+        prev_interest_date=prev_interest_date,
+        interest_cycle=interest_cycle,
+        prev_repayment_date=prev_repayment_date,
+        repayment_cycle=repayment_cycle,
+        repayment_use_stash=repayment_use_stash,
+        fixed_principal=fixed_principal,
+        fixed_interest_rate=fixed_interest_rate,
+        fixed_repayment=fixed_repayment,
+        fixed_end=fixed_end,
+        variable_principal=variable_principal,
+        variable_interest_rate=variable_interest_rate,
+        variable_repayment=variable_repayment,
+        offset=offset,
+        schedule_end=schedule_end,
+        extra_win_amount=extra_win_amount,
+        extra_win_cycle=extra_win_cycle,
+        extra_win_duration=extra_win_duration,
+        accrual_exact=accrual_exact,
+    ):
+        schedules[account].append(day, amounts)
+
+    # return result
+
+    days = np.concatenate([schedule.days[: schedule.size] for schedule in schedules])
+    amounts = np.concatenate(
+        [schedule.amounts[:, : schedule.size] for schedule in schedules], axis=1
+    )
+    accounts = np.repeat(split_loan_accounts, [schedule.size for schedule in schedules])
+
+    return _get_schedule(
+        schedule_start + pd.to_timedelta(days, unit="D"),
+        amounts,
+        loan_start,
+        schedule_start,
+        extra_columns={"Account": accounts},
+    )
+
+
+sweep_columns = [
+    "LoanYears",
+    "ScheduleYears",
+    "TotalInterest",
+    "TotalRepayment",
+    "TotalExtraWinForLoan",
+    "TotalExtraWinForUs",
+    "Principal",
+    "Stash",
+]
+
+
+def _sweep_chunk(names, shape, grid, start, end, kwargs):
+    # note: runs in a worker process, the summaries of the scenarios start to end (excluded)
+    #       are written straight into the shared result arrays, scenarios that do not
+    #       finish within 100 years are left as NaN (NaT)
+
+    summaries_memory = shared_memory.SharedMemory(name=names[0])
+    end_dates_memory = shared_memory.SharedMemory(name=names[1])
+    try:
+        summaries = np.ndarray(
+            (shape[0], len(sweep_columns)), dtype=float, buffer=summaries_memory.buf
+        )
+        end_dates = np.ndarray(shape[0], dtype=np.int64, buffer=end_dates_memory.buf)
+
+        keys = list(grid)
+        for index in range(start, end):
+            positions = np.unravel_index(index, shape[1:])
+            scenario = {
+                key: grid[key][position] for key, position in zip(keys, positions)
+            }
+
+            try:
+                summary = simulate_summary(**kwargs, **scenario)
+            except RuntimeError:
+                continue
+
+            summaries[index] = (
+                summary.loan_years,
+                summary.schedule_years,
+                summary.total_interest,
+                summary.total_repayment,
+                summary.total_extra_win_for_loan,
+                summary.total_extra_win_for_us,
+                summary.principal,
+                summary.stash,
+            )
+            end_dates[index] = summary.end_date.as_unit("ns").value
+
+        del summaries, end_dates
+    finally:
+        summaries_memory.close()
+        end_dates_memory.close()
+
+    return end - start
+
+
+def sweep(
+    grid,
+    *,
+    workers=None,
+    chunk_size=64,
+    progress=None,
+    cancel=None,
+    **kwargs,
+) -> pd.DataFrame:
+    # note: takes the same parameters as simulate, except for the ones in grid,
+    #       which maps parameter names to the values to sweep over, all combinations
+    #       are simulated (as simulate_summary), in chunks of chunk_size on a process pool,
+    #       the summaries are written into shared memory by the workers,
+    #       the result has one row per combination, in the order of the grid (the last
+    #       parameter changing fastest), regardless of the order the chunks finish in,
+    #       progress is called with (done, total) after each chunk, and the sweep stops
+    #       with CancelledError as soon as cancel (e.g. a threading.Event) is set
+
+    grid = {key: list(values) for key, values in grid.items()}
+    shape = (math.prod(len(values) for values in grid.values()),) + tuple(
+        len(values) for values in grid.values()
+    )
+    total = shape[0]
+
+    summaries_memory = shared_memory.SharedMemory(
+        create=True, size=max(1, total * len(sweep_columns) * 8)
+    )
+    end_dates_memory = shared_memory.SharedMemory(create=True, size=max(1, total * 8))
+    try:
+        summaries = np.ndarray(
+            (total, len(sweep_columns)), dtype=float, buffer=summaries_memory.buf
+        )
+        end_dates = np.ndarray(total, dtype=np.int64, buffer=end_dates_memory.buf)
+        summaries[:] = np.nan
+        end_dates[:] = np.iinfo(np.int64).min  # note: NaT
+
+        names = (summaries_memory.name, end_dates_memory.name)
+        chunks = [
+            (start, min(start + chunk_size, total))
+            for start in range(0, total, chunk_size)
+        ]
+
+        done = 0
+        if workers == 0:
+            # note: without a process pool, e.g. for small grids or debugging
+
+            for start, end in chunks:
+                if cancel is not None and cancel.is_set():
+                    raise CancelledError()
+                done = done + _sweep_chunk(names, shape, grid, start, end, kwargs)
+                if progress is not None:
+                    progress(done, total)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        _sweep_chunk, names, shape, grid, start, end, kwargs
+                    )
+                    for start, end in chunks
+                ]
+                try:
+                    for future in as_completed(futures):
+                        if cancel is not None and cancel.is_set():
+                            raise CancelledError()
+                        done = done + future.result()
+                        if progress is not None:
+                            progress(done, total)
+                except BaseException:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+
+        # return result
+
+        index = pd.MultiIndex.from_product(list(grid.values()), names=list(grid))
+        df = index.to_frame(index=False)
+        df["EndDate"] = pd.to_datetime(end_dates.copy(), unit="ns")
+        for i, column in enumerate(sweep_columns):
+            df[column] = summaries[:, i].copy()
+
+        del summaries, end_dates
+        return df
+    finally:
+        summaries_memory.close()
+        summaries_memory.unlink()
+        end_dates_memory.close()
+        end_dates_memory.unlink()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    memory: int = 0
+
+
+def _normalize_parameter(value):
+    # note: equal parameters need to be normalized to the same value,
+    #       e.g. 500000 and 500000.0 or a Timestamp and an equal datetime
+
+    if value is None or isinstance(value, (bool, np.bool_, str)):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return ("Timestamp", pd.Timestamp(value).isoformat())
+    if isinstance(value, (pd.Timedelta, timedelta)):
+        return ("Timedelta", pd.Timedelta(value).value)
+    if isinstance(value, Cycle):
+        return ("Cycle", value.name)
+    if isinstance(value, StepSchedule):
+        return (type(value).__name__, tuple(value.dates), tuple(value.values))
+    if isinstance(value, (list, tuple, np.ndarray, pd.Series)):
+        return ("Array", tuple(_normalize_parameter(item) for item in value))
+    raise TypeError("Unsupported parameter: " + type(value).__name__)
+
+
+def get_cache_key(name, **kwargs) -> str:
+    normalized = sorted(
+        (key, _normalize_parameter(value)) for key, value in kwargs.items()
+    )
+    return hashlib.sha256(repr((name, normalized)).encode()).hexdigest()
+
+
+def _freeze(df: pd.DataFrame) -> pd.DataFrame:
+    # note: the cached data is kept in read-only arrays, callers get views on it
+
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy(copy=True)
+        values.flags.writeable = False
+        columns[column] = values
+    frozen = pd.DataFrame(columns, columns=df.columns, copy=False)
+    frozen.attrs = dict(df.attrs)
+    return frozen
+
+
+class SimulationCache:
+    # note: bounded by number of entries and memory, least recently used entries are evicted first,
+    #       entries expire after ttl (if given)
+
+    def __init__(
+        self,
+        *,
+        max_entries=128,
+        max_memory=256 * 1024 * 1024,
+        ttl: timedelta | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (frozen result, memory, expiry)
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.entries = 0
+            self._stats.memory = 0
+
+    def simulate(self, **kwargs) -> pd.DataFrame:
+        return self._get_or_run("simulate", simulate, kwargs)
+
+    def simulate_batch(self, **kwargs) -> pd.DataFrame:
+        return self._get_or_run("simulate_batch", simulate_batch, kwargs)
+
+    def simulate_split_loan(self, **kwargs) -> pd.DataFrame:
+        return self._get_or_run("simulate_split_loan", simulate_split_loan, kwargs)
+
+    def _get_or_run(self, name, func, kwargs) -> pd.DataFrame:
+        key = get_cache_key(name, **kwargs)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None:
+                if entry[2] < time.monotonic():
+                    self._remove(key)
+                    self._stats.evictions += 1
+                    entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry[0].copy(deep=False)
+            self._stats.misses += 1
+
+        # note: the simulation runs outside of the lock, concurrent misses simply run twice
+
+        frozen = _freeze(func(**kwargs))
+        memory = int(frozen.memory_usage(index=True, deep=True).sum())
+        expiry = time.monotonic() + self.ttl.total_seconds() if self.ttl else None
+
+        with self._lock:
+            if memory <= self.max_memory:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (frozen, memory, expiry)
+                self._stats.entries += 1
+                self._stats.memory += memory
+
+                while (
+                    len(self._entries) > self.max_entries
+                    or self._stats.memory > self.max_memory
+                ):
+                    self._remove(next(iter(self._entries)))
+                    self._stats.evictions += 1
+
+        return frozen.copy(deep=False)
+
+    def _remove(self, key):
+        _, memory, _ = self._entries.pop(key)
+        self._stats.entries -= 1
+        self._stats.memory -= memory
+
+
+simulation_cache = SimulationCache()
@@ -0,0 +1,236 @@
+import io
+import os
+import shutil
+import zipfile
+import pandas as pd
+import pytest
+import account_reader as ar
+
+
+def write_statement(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame(
+        rows, columns=["Date", "Description", "Credit", "Debit", "Balance"]
+    ).to_csv(path, index=False)
+
+
+@pytest.fixture
+def data_folder(tmp_path):
+    loans = tmp_path / "Loans"
+    write_statement(
+        loans / "Fixed" / "2025-01.csv",
+        [
+            ["31/01/2025", "Interest", 0, -1500.0, -400000.0],
+            ["15/01/2025", "Repayment", 2800.0, 0, -398500.0],
+        ],
+    )
+    write_statement(
+        loans / "Variable" / "2025-01.csv",
+        [
+            ["31/01/2025", "Interest", 0, -900.0, -200000.0],
+            ["20/01/2025", "Transfer", 5000.0, 0, -199100.0],
+        ],
+    )
+    write_statement(
+        loans / "Offset" / "2025-01.csv",
+        [
+            ["10/01/2025", "Salary", 6000.0, 0, 56000.0],
+            ["12/01/2025", "Groceries", 0, -200.0, 55800.0],
+        ],
+    )
+    # note: an export without transactions, which only has the header
+    write_statement(loans / "Variable" / "2025-02.csv", [])
+    # note: overlapping exports, which are removed as duplicates
+    write_statement(
+        loans / "Offset" / "2025-01-overlap.csv",
+        [
+            ["12/01/2025", "Groceries", 0, -200.0, 55800.0],
+            ["14/01/2025", "Rent", 0, -2000.0, 53800.0],
+        ],
+    )
+    return str(tmp_path)
+
+
+def test_reader_manifest(data_folder, monkeypatch):
+    parsed = []
+    parse_statement = ar._parse_statement
+
+    def counting_parse_statement(file, *args):
+        parsed.append(file)
+        return parse_statement(file, *args)
+
+    monkeypatch.setattr(ar, "_parse_statement", counting_parse_statement)
+
+    def check():
+        parsed.clear()
+        df = ar.get_dataframe(data_folder)
+        parsed_files = list(parsed)
+        pd.testing.assert_frame_equal(
+            df, ar.get_dataframe(data_folder, use_manifest=False)
+        )
+        return df, parsed_files
+
+    df, parsed_files = check()
+    assert len(df) == 7
+    assert len(parsed_files) == 5
+    assert os.path.isfile(os.path.join(data_folder, ar.manifest_file))
+
+    # unchanged statements are not parsed again, unchanged accounts are read from their partitions
+
+    load_manifest = ar.load_manifest
+    loaded = []
+    monkeypatch.setattr(
+        ar, "load_manifest", lambda *args: loaded.append(args) or load_manifest(*args)
+    )
+
+    df, parsed_files = check()
+    assert parsed_files == []
+    assert loaded == []
+    for account_name in ["Fixed", "Variable", "Offset"]:
+        assert os.path.isfile(
+            os.path.join(data_folder, ar.partition_folder, account_name + ".arrow")
+        )
+
+    # touched but unchanged statements are hashed, not parsed
+
+    offset = os.path.join(data_folder, "Loans", "Offset", "2025-01.csv")
+    os.utime(offset, ns=(0, 0))
+    df, parsed_files = check()
+    assert parsed_files == []
+    assert len(loaded) == 1
+
+    # new, changed and removed statements
+
+    write_statement(
+        os.path.join(data_folder, "Loans", "Fixed", "2025-02.csv"),
+        [["28/02/2025", "Interest", 0, -1400.0, -398500.0]],
+    )
+    write_statement(offset, [["10/01/2025", "Salary", 6500.0, 0, 56500.0]])
+    os.remove(os.path.join(data_folder, "Loans", "Variable", "2025-01.csv"))
+
+    df, parsed_files = check()
+    assert sorted(parsed_files) == sorted(
+        [offset, os.path.join(data_folder, "Loans", "Fixed", "2025-02.csv")]
+    )
+    assert len(df) == 6
+    assert len(ar.load_manifest(data_folder)) == 5
+
+    # a corrupt manifest is the same as an empty one
+
+    shutil.rmtree(os.path.join(data_folder, ar.partition_folder))
+    with open(os.path.join(data_folder, ar.manifest_file), "wb") as file:
+        file.write(b"not a manifest")
+    assert ar.load_manifest(data_folder) == {}
+    df, parsed_files = check()
+    assert len(parsed_files) == 5
+
+
+def test_reader_workers(data_folder):
+    df = ar.get_dataframe(data_folder, use_manifest=False)
+
+    timings = []
+    df_workers = ar.get_dataframe(
+        data_folder, use_manifest=False, workers=4, timings=timings
+    )
+    pd.testing.assert_frame_equal(df, df_workers)
+    assert sorted(file for file, _ in timings) == sorted(
+        file
+        for account_name in ["Fixed", "Variable", "Offset"]
+        for file in ar.get_statement_files(
+            os.path.join(data_folder, "Loans"), account_name
+        )
+    )
+
+    # statements are parsed once, afterwards the partitions are read
+
+    timings = []
+    ar.get_dataframe(data_folder, workers=4, timings=timings)
+    assert len(timings) == 5
+    timings = []
+    pd.testing.assert_frame_equal(
+        df, ar.get_dataframe(data_folder, workers=4, timings=timings)
+    )
+    assert sorted(file for file, _ in timings) == sorted(
+        ar.get_partition_file(data_folder, account_name)
+        for account_name in ["Fixed", "Variable", "Offset"]
+    )
+
+
+def test_reader_labels(data_folder):
+    df = ar.get_dataframe(data_folder)
+    pd.testing.assert_series_equal(
+        df["Label"], df.apply(ar.label_row, axis=1), check_names=False
+    )
+    assert set(df["Label"]) == {
+        "Interest",
+        "Repayment",
+        "Extrarepayment",
+        "OffsetUp",
+        "OffsetDown",
+    }
+
+    # another bank's description patterns are added as rules before the default ones
+
+    rules = [
+        ar.LabelRule(
+            "Repayment", direction="credit", description="(?i)^transfer", regex=True
+        ),
+        ar.LabelRule("Groceries", account_name="Offset", description="Groceries"),
+        *ar.label_rules,
+    ]
+    df_rules = ar.get_dataframe(data_folder, label_rules=rules)
+    labels = dict(zip(df_rules["Description"], df_rules["Label"]))
+    assert labels["Transfer"] == "Repayment"
+    assert labels["Groceries"] == "Groceries"
+    assert labels["Rent"] == "OffsetDown"
+    assert (df_rules["Label"] != df["Label"]).sum() == 2
+
+    with pytest.raises(ValueError):
+        ar.label_transactions(df, [ar.LabelRule("Unknown", direction="sideways")])
+
+
+def test_reader_uploads(data_folder, monkeypatch):
+    df = ar.get_dataframe(data_folder, use_manifest=False)
+
+    upload = io.BytesIO()
+    with zipfile.ZipFile(upload, "w") as zip_file:
+        zip_file.writestr("Loans/Unknown/2025-01.csv", "Date\n01/01/2025\n")
+        for account_name in ["Fixed", "Variable", "Offset"]:
+            for file in ar.get_statement_files(
+                os.path.join(data_folder, "Loans"), account_name
+            ):
+                zip_file.write(file, os.path.relpath(file, data_folder))
+
+    parsed = []
+    parse_statement = ar._parse_statement
+    monkeypatch.setattr(
+        ar,
+        "_parse_statement",
+        lambda *args: parsed.append(args) or parse_statement(*args),
+    )
+
+    df_upload = ar.read_accounts_from_zip(upload)
+    assert list(df_upload["File"]) == [
+        os.path.relpath(file, data_folder) for file in df["File"]
+    ]
+    pd.testing.assert_frame_equal(
+        df.drop(columns="File"), df_upload.drop(columns="File")
+    )
+    assert len(parsed) == 5
+
+    # reruns with the same upload reuse its statements
+
+    df_rerun = ar.read_accounts_from_zip(io.BytesIO(upload.getvalue()))
+    pd.testing.assert_frame_equal(df_upload, df_rerun)
+    assert len(parsed) == 5
+
+    # statements as (account, file-like) pairs
+
+    with zipfile.ZipFile(upload) as zip_file:
+        statements = [
+            (name.split("/")[1], io.BytesIO(zip_file.read(name)))
+            for name in reversed(zip_file.namelist())
+        ]
+    df_statements = ar.read_accounts_from_statements(statements)
+    assert set(df_statements["Label"]) == set(df["Label"])
+    assert len(df_statements) == len(df)
@@ -1,3 +1,7 @@
+from concurrent.futures import CancelledError
+import threading
+from dateutil.relativedelta import relativedelta
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -24,6 +28,122 @@ def test_planner_basics(N, k, P, R0, c0):
     assert round(planner.c0) == c0
 
 
+def test_planner_arrays():
+    N = np.array([0, 15, 20, 25, 30])[:, None]
+    k = np.array([365 / 14, 12])[:, None, None]
+    P = np.array([-1, 0, 500000, 1000000])[:, None, None, None]
+    R0 = np.array([0, 0.05, 0.08])[:, None, None, None, None]
+
+    planner = hlp.HomeLoanPlanner("TestLoans", N=N, k=k, P=P, R0=R0)
+    assert planner.c0.shape == (3, 4, 2, 5, 1)
+
+    for index in np.ndindex(planner.c0.shape):
+        N_, k_, P_, R0_ = (
+            planner.N[index],
+            planner.k[index],
+            planner.P[index],
+            planner.R0[index],
+        )
+        if P_ <= 0 or N_ == 0:
+            assert np.isnan(planner.c0[index])
+        elif R0_ == 0:
+            assert planner.c0[index] == pytest.approx(P_ / (N_ * k_))
+        else:
+            c0 = hlp.HomeLoanPlanner("TestLoan", N=N_, k=k_, P=P_, R0=R0_).c0
+            assert planner.c0[index] == pytest.approx(c0)
+            assert planner.m0[index] == pytest.approx(c0 * k_ / 12)
+
+
+def test_planner_inverses():
+    n = np.array([1, 12, 360, 780])
+    p = np.array([1000, 500000, 1000000])[:, None]
+    r = np.array([0, 0.0001, 0.05 / 12, 0.08 / 26, 0.02])[:, None, None]
+    c = hlp.HomeLoanPlanner.get_recurring_payments_c(n=n, p=p, r=r)
+
+    n_ = hlp.HomeLoanPlanner.get_payment_count_n(c=c, p=p, r=r)
+    assert n_ == pytest.approx(np.broadcast_to(n, c.shape), rel=1e-9)
+
+    p_ = hlp.HomeLoanPlanner.get_principal_p(c=c, n=n, r=r)
+    assert p_ == pytest.approx(np.broadcast_to(p, c.shape), rel=1e-9)
+
+    r_ = hlp.HomeLoanPlanner.get_rate_r(c=c, n=n, p=p)
+    assert r_ == pytest.approx(np.broadcast_to(r, c.shape), rel=1e-6, abs=1e-12)
+
+    assert hlp.HomeLoanPlanner.get_payment_count_n(c=100, p=10000, r=0.01) == np.inf
+    assert hlp.HomeLoanPlanner.get_payment_count_n(c=100, p=0, r=0.01) == 0
+    assert np.isnan(hlp.HomeLoanPlanner.get_rate_r(c=90, n=10, p=1000))
+
+
+def test_planner_amortization_schedule():
+    start = pd.to_datetime("2025-01-01")
+
+    planner = hlp.HomeLoanPlanner("TestLoan", N=25, k=12, P=500000, R0=0.06)
+    df = planner.get_amortization_schedule(loan_start=start, schedule_start=start)
+    assert list(df.columns) == hls.schedule_columns
+    assert len(df) == 25 * 12 + 1
+    assert df["Repayment"][1:].to_numpy() == pytest.approx(planner.c0)
+    assert df["Principal"].iloc[-1] == 0
+    assert df["Interest"].sum() == pytest.approx(25 * 12 * planner.c0 - 500000)
+
+    # with fast_path, the simulator dispatches to the planner for identical cycles of constant length
+
+    for cycle, repayment, accrual_exact in [
+        (hls.Cycle.FORTNIGHTLY, 1400, False),
+        (hls.Cycle.MONTHLY_AVERAGE, 3100, False),
+        (hls.Cycle.YEARLY, 36000, True),
+    ]:
+        params = dict(
+            loan_start=start,
+            principal=500000,
+            offset=60000,
+            schedule_start=start,
+            interest_rate=6.0,
+            prev_interest_date=start - pd.Timedelta(days=3),
+            interest_cycle=cycle,
+            repayment=repayment,
+            prev_repayment_date=start - pd.Timedelta(days=3),
+            repayment_cycle=cycle,
+            repayment_use_stash=False,
+            accrual_exact=accrual_exact,
+        )
+
+        df = hls.simulate(**params, fast_path=True)
+        df_events, _ = hls.simulate_with_checkpoints(**params)
+        assert hls.simulate(**params).equals(df_events)
+        assert pd.DataFrame(list(hls.iter_schedule(**params))).equals(df_events)
+        assert df["Date"].equals(df_events["Date"])
+        for column in hls.amount_columns:
+            assert df[column].to_numpy() == pytest.approx(
+                df_events[column].to_numpy(), nan_ok=True
+            )
+
+    with pytest.raises(RuntimeError):
+        hls.simulate(**params | dict(repayment=20000), fast_path=True)
+
+
+@pytest.mark.parametrize("cycle", list(hls.Cycle))
+@pytest.mark.parametrize(
+    "anchor",
+    [
+        pd.to_datetime("2024-01-31 08:30"),
+        pd.to_datetime("2024-02-14"),
+        pd.to_datetime("2024-12-01"),
+    ],
+)
+def test_cycle_calendar(cycle, anchor):
+    horizon = anchor + pd.Timedelta(days=3 * 365)
+
+    calendar = hls.get_cycle_calendar(anchor, cycle, horizon)
+
+    date = anchor
+    for i in range(len(calendar)):
+        date = hls.increment_date(date, cycle)
+        assert calendar[i] == date
+
+    assert calendar[len(calendar) - 2] <= horizon < calendar[len(calendar) - 1]
+    assert hls.get_cycle_calendar(anchor, cycle, horizon) is calendar
+
+
 @pytest.mark.parametrize(
     "N, cycle, P, R0",
     [
@@ -173,3 +293,896 @@ def test_simulator_basics(N, cycle, P, R0):
         )
         == 0
     )
+
+
+@pytest.mark.parametrize(
+    "interest_cycle, repayment_cycle",
+    [
+        (hls.Cycle.MONTHLY_END_OF_MONTH, hls.Cycle.FORTNIGHTLY),
+        (hls.Cycle.MONTHLY_AVERAGE, hls.Cycle.MONTHLY_1ST_OF_MONTH),
+        (hls.Cycle.FORTNIGHTLY, hls.Cycle.YEARLY),
+    ],
+)
+def test_simulator_events(interest_cycle, repayment_cycle):
+    start = pd.to_datetime("2025-03-17")
+    leftover_incoming = pd.to_datetime("2027-05-01")
+
+    df = hls.simulate(
+        loan_start=start - pd.Timedelta(days=100),
+        principal=300000,
+        offset=20000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start - pd.Timedelta(days=10),
+        interest_cycle=interest_cycle,
+        repayment=5000 if not repayment_cycle.is_yearly() else 60000,
+        prev_repayment_date=start - pd.Timedelta(days=3),
+        repayment_cycle=repayment_cycle,
+        repayment_use_stash=False,
+        leftover_incoming=leftover_incoming,
+        leftover_amount=100000,
+        leftover_repayment=1000,
+        extra_win_amount=2000,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 20),
+    )
+
+    # every row but the first one has at least one event
+
+    events = df[
+        ["Interest", "Redraw", "Repayment", "ExtraWinForLoan", "ExtraWinForUs"]
+    ].iloc[1:]
+    assert events.notna().any(axis=1).all()
+
+    # the leftover is redrawn exactly once, on the day it comes in
+
+    redraws = df["Redraw"].iloc[1:].dropna()
+    assert len(redraws) == 1
+    assert df.loc[redraws.index[0], "Date"] == leftover_incoming
+
+    # extra wins continue after the loan is paid off, until the end of their duration
+
+    assert df.iloc[-1]["Principal"] == 0
+    assert df.iloc[-1]["ExtraWinForUs"] == 2000
+    assert df.iloc[-1]["Date"] <= start + pd.Timedelta(days=365 * 20)
+
+    # all money is accounted for
+
+    assert (
+        round(
+            df["Redraw"].sum()
+            + df["Interest"].sum()
+            - df["Repayment"].sum()
+            - df["ExtraWinForLoan"].sum()
+        )
+        == 0
+    )
+
+    # a maturity ends the schedule early, with a final interest calculation
+
+    schedule_end = pd.to_datetime("2026-02-10 12:00")
+
+    df_maturity = hls.simulate(
+        loan_start=start,
+        principal=300000,
+        offset=0,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=interest_cycle,
+        repayment=5000,
+        prev_repayment_date=start,
+        repayment_cycle=repayment_cycle,
+        repayment_use_stash=False,
+        schedule_end=schedule_end,
+    )
+
+    assert df_maturity.iloc[-1]["Date"] == pd.to_datetime("2026-02-11")
+    assert df_maturity.iloc[-1]["Interest"] > 0
+    assert df_maturity.iloc[-1]["Principal"] > 0
+
+
+def test_simulator_batch():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        schedule_start=start,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+        leftover_incoming=pd.to_datetime("2027-05-01"),
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+    )
+
+    scenarios = [
+        dict(principal=500000, offset=0, interest_rate=6.0, repayment=2000),
+        dict(principal=500000, offset=0, interest_rate=5.0, repayment=2000),
+        dict(principal=400000, offset=50000, interest_rate=6.0, repayment=2500),
+        dict(principal=500000, offset=0, interest_rate=6.0, repayment=2000),
+        dict(principal=50000, offset=0, interest_rate=6.0, repayment=2000),
+    ]
+    leftover_amounts = [100000, None, 100000, 100000, None]
+    extra_win_amounts = [None, None, None, 500, None]
+
+    # note: only one scenario has an extra win duration, which extends only its continuation
+    extra_win_durations = [None, None, None, pd.Timedelta(days=365 * 10), None]
+
+    df_batch = hls.simulate_batch(
+        **params,
+        principal=[scenario["principal"] for scenario in scenarios],
+        offset=[scenario["offset"] for scenario in scenarios],
+        interest_rate=[scenario["interest_rate"] for scenario in scenarios],
+        repayment=[scenario["repayment"] for scenario in scenarios],
+        leftover_amount=leftover_amounts,
+        leftover_repayment=1000,
+        extra_win_amount=extra_win_amounts,
+        extra_win_duration=extra_win_durations,
+    )
+
+    assert list(df_batch["Scenario"].unique()) == [0, 1, 2, 3, 4]
+
+    for i, scenario in enumerate(scenarios):
+        df = hls.simulate(
+            **params,
+            **scenario,
+            leftover_amount=leftover_amounts[i],
+            leftover_repayment=1000,
+            extra_win_amount=extra_win_amounts[i],
+            extra_win_duration=extra_win_durations[i],
+        )
+
+        df_scenario = df_batch[df_batch["Scenario"] == i].drop(columns="Scenario")
+        df_scenario = df_scenario.reset_index(drop=True)
+
+        assert len(df_scenario) == len(df)
+        assert (df_scenario["Date"] == df["Date"]).all()
+        for column in ["Interest", "Repayment", "Principal", "Stash", "ExtraWinForUs"]:
+            assert list(df_scenario[column].fillna(0)) == pytest.approx(
+                list(df[column].astype(float).fillna(0))
+            )
+
+
+def test_simulator_rate_paths():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        principal=500000,
+        offset=20000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=2000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+        leftover_incoming=pd.to_datetime("2027-05-01"),
+        leftover_amount=100000,
+        leftover_repayment=1000,
+    )
+
+    # without volatility, all paths are the simulation at the fixed rate
+
+    bands = hls.simulate_rate_paths(**params, paths=10, volatility=0)
+    df = hls.simulate(**params, loan_start=start)
+
+    assert (bands.end_date == df["Date"].iloc[-1]).all()
+    assert (bands.interest_rate.drop(columns="Date") == 6.0).all().all()
+    assert list(bands.principal["P50"]) == pytest.approx(
+        list(df.groupby("Date")["Principal"].last().astype(float))
+    )
+
+    # with volatility, the bands are ordered and reproducible by seed
+
+    bands = hls.simulate_rate_paths(**params, paths=500, seed=1)
+    assert bands.end_date.is_monotonic_increasing
+    assert bands.end_date["P5"] < bands.end_date["P95"]
+    assert (bands.principal["P5"] <= bands.principal["P95"]).all()
+
+    bands_again = hls.simulate_rate_paths(**params, paths=500, seed=1)
+    assert (bands.end_date == bands_again.end_date).all()
+
+    # paths not paid off within 100 years have no end date, instead of failing all paths
+
+    params.update(
+        offset=0, repayment=1300, leftover_amount=None, leftover_repayment=None
+    )
+    with pytest.raises(RuntimeError):
+        hls.simulate_batch(**{**params, "interest_rate": 8.0}, loan_start=start)
+
+    bands = hls.simulate_rate_paths(**params, paths=1000, volatility=2.5, seed=1)
+    assert not pd.isna(bands.end_date["P50"])
+    assert pd.isna(bands.end_date["P95"])
+    assert bands.principal["P95"].iloc[-1] > 0
+    assert bands.principal["Date"].iloc[-1] <= start + pd.Timedelta(
+        days=hls.max_schedule_days + 1
+    )
+
+
+def test_simulator_split_loan():
+    loan_start = pd.to_datetime("2023-03-17")
+    start = pd.to_datetime("2025-03-17")
+    fixed_end = loan_start + pd.Timedelta(days=365 * 3)
+
+    params = dict(
+        loan_start=loan_start,
+        schedule_start=start,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+    )
+
+    df = hls.simulate_split_loan(
+        **params,
+        fixed_principal=300000,
+        fixed_interest_rate=5.5,
+        fixed_repayment=1500,
+        fixed_end=fixed_end,
+        variable_principal=400000,
+        variable_interest_rate=6.2,
+        variable_repayment=1800,
+        offset=50000,
+        extra_win_amount=500,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 10),
+    )
+
+    # the same as the fixed loan followed by the variable loan with the leftover
+
+    df_fixed = hls.simulate(
+        **params,
+        principal=300000,
+        offset=0,
+        interest_rate=5.5,
+        repayment=1500,
+        schedule_end=fixed_end,
+    )
+    df_variable = hls.simulate(
+        **params,
+        principal=400000,
+        offset=50000,
+        interest_rate=6.2,
+        repayment=1800,
+        leftover_incoming=fixed_end,
+        leftover_amount=df_fixed.iloc[-1]["Principal"],
+        leftover_repayment=1500,
+        extra_win_amount=500,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 10),
+    )
+
+    assert list(df["Account"].unique()) == ["Fixed", "Variable"]
+    for account, df_account in [("Fixed", df_fixed), ("Variable", df_variable)]:
+        df_split = df[df["Account"] == account].drop(columns="Account")
+        assert df_split.reset_index(drop=True).equals(df_account)
+
+
+def test_simulator_sweep():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        offset=50000,
+        schedule_start=start,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+    )
+    grid = dict(
+        principal=[500000, 800000],
+        interest_rate=[5.0, 7.0],
+        repayment=[1000, 2000, 3000, 4000, 5000],
+    )
+
+    df = hls.sweep(grid, workers=2, chunk_size=3, **params)
+    assert df.equals(hls.sweep(grid, workers=0, **params))
+
+    # one row per combination, in grid order, unfinished scenarios are NaN
+
+    assert len(df) == 20
+    assert list(df["repayment"][:5]) == grid["repayment"]
+
+    for _, row in df.iterrows():
+        scenario = dict(
+            principal=row["principal"],
+            interest_rate=row["interest_rate"],
+            repayment=row["repayment"],
+        )
+        try:
+            summary = hls.simulate_summary(**params, **scenario)
+        except RuntimeError:
+            assert pd.isna(row["EndDate"]) and pd.isna(row["TotalInterest"])
+            continue
+        assert row["EndDate"] == summary.end_date
+        assert row["TotalInterest"] == summary.total_interest
+
+    # progress and cancellation
+
+    calls = []
+    cancel = threading.Event()
+
+    def progress(done, total):
+        calls.append((done, total))
+        cancel.set()
+
+    with pytest.raises(CancelledError):
+        hls.sweep(
+            grid, workers=0, chunk_size=3, progress=progress, cancel=cancel, **params
+        )
+    assert calls == [(3, 20)]
+
+
+def test_simulator_cache():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        principal=500000,
+        offset=0,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=3000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment_use_stash=False,
+    )
+
+    cache = hls.SimulationCache(max_entries=2)
+
+    df = cache.simulate(**params)
+    assert cache.stats.misses == 1
+
+    # equal parameters of different types hit the same entry
+
+    df_hit = cache.simulate(
+        **{
+            **params,
+            "principal": 500000.0,
+            "schedule_start": start.to_pydatetime(),
+        }
+    )
+    assert cache.stats.hits == 1
+    assert df_hit.equals(df)
+
+    # cached results cannot be corrupted by callers
+
+    try:
+        df_hit.loc[0, "Principal"] = 0
+    except ValueError:
+        pass
+    assert cache.simulate(**params).loc[0, "Principal"] == 500000
+
+    # least recently used entries are evicted
+
+    cache.simulate(**{**params, "interest_rate": 5.0})
+    cache.simulate(**{**params, "interest_rate": 4.0})
+    assert cache.stats.evictions == 1
+    assert cache.stats.entries == 2
+    assert cache.stats.memory > 0
+
+    cache.simulate(**params)
+    assert cache.stats.misses == 4
+
+
+@pytest.mark.parametrize(
+    "cycle, same_as_daily",
+    [
+        (hls.Cycle.FORTNIGHTLY, True),
+        (hls.Cycle.MONTHLY_AVERAGE, False),
+    ],
+)
+def test_simulator_accrual_exact(cycle, same_as_daily):
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        principal=500000,
+        offset=10000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=cycle,
+        repayment=1000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.MONTHLY_1ST_OF_MONTH,
+        repayment_use_stash=False,
+        schedule_end=start + pd.Timedelta(days=3 * 365),
+    )
+
+    df_daily = hls.simulate(**params)
+    df_exact = hls.simulate(**params, accrual_exact=True)
+
+    assert len(df_exact) == len(df_daily)
+
+    interest_daily = df_daily["Interest"].fillna(0)
+    interest_exact = df_exact["Interest"].fillna(0)
+
+    if same_as_daily:
+        assert list(interest_exact) == pytest.approx(list(interest_daily))
+    else:
+        assert list(interest_exact) != pytest.approx(list(interest_daily))
+        assert interest_exact.sum() == pytest.approx(interest_daily.sum(), rel=1e-3)
+
+
+def test_simulator_columns():
+    start = pd.to_datetime("2025-03-17")
+
+    df = hls.simulate(
+        loan_start=start - pd.Timedelta(days=400),
+        principal=100000,
+        offset=0,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_1ST_OF_MONTH,
+        repayment=1000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+    )
+
+    # amounts are plain floats, with NaN for days without the respective event
+
+    assert list(df.columns) == hls.schedule_columns
+    assert (df[hls.amount_columns].dtypes == "float64").all()
+    assert df["Interest"].isna().any()
+
+    # durations are only added on request
+
+    df_durations = hls.add_durations(df, loan_start=start, schedule_start=start)
+
+    assert list(df_durations.columns[1:5]) == [
+        "LoanYears",
+        "LoanDuration",
+        "ScheduleYears",
+        "ScheduleDuration",
+    ]
+    assert df_durations.iloc[0]["ScheduleDuration"] == relativedelta()
+    assert df_durations.iloc[-1]["ScheduleDuration"] == relativedelta(
+        df.iloc[-1]["Date"], start
+    )
+    assert "LoanDuration" not in df.columns
+
+
+def test_simulator_rate_schedule():
+    start = pd.to_datetime("2025-01-31")
+
+    params = dict(
+        loan_start=start,
+        principal=100000,
+        offset=0,
+        schedule_start=start,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=0,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment_use_stash=False,
+        schedule_end=pd.to_datetime("2025-04-30"),
+    )
+
+    for accrual_exact in [False, True]:
+        # a single rate is the same as a scalar rate
+
+        df = hls.simulate(**params, interest_rate=6.0, accrual_exact=accrual_exact)
+        df_schedule = hls.simulate(
+            **params,
+            interest_rate=[(pd.to_datetime("2020-01-01"), 6.0)],
+            accrual_exact=accrual_exact,
+        )
+        assert list(df_schedule["Interest"].fillna(0)) == pytest.approx(
+            list(df["Interest"].fillna(0))
+        )
+
+        # a rate change within an interest period applies from its date onwards
+
+        df_schedule = hls.simulate(
+            **params,
+            interest_rate=hls.RateSchedule(
+                [pd.to_datetime("2020-01-01"), pd.to_datetime("2025-02-10")],
+                [6.0, 4.0],
+            ),
+            accrual_exact=accrual_exact,
+        )
+        assert df_schedule["Interest"][1] == pytest.approx(
+            100000 * (0.06 * 10 + 0.04 * 18) / 365
+        )
+        assert df_schedule["Interest"][2] == pytest.approx(
+            df_schedule["Principal"][1] * 0.04 * 31 / 365
+        )
+
+    with pytest.raises(ValueError):
+        hls.RateSchedule([start, start], [6.0, 4.0])
+
+
+def test_simulator_offset_schedule():
+    start = pd.to_datetime("2025-01-31")
+
+    params = dict(
+        loan_start=start,
+        principal=100000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=0,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment_use_stash=False,
+        schedule_end=pd.to_datetime("2025-04-30"),
+    )
+
+    def get_transactions():
+        yield pd.to_datetime("2025-02-10"), 30000
+        yield pd.to_datetime("2025-02-15"), -10000
+        yield pd.to_datetime("2025-02-15"), -5000
+
+    for accrual_exact in [False, True]:
+        # a single balance is the same as a scalar offset
+
+        df = hls.simulate(**params, offset=10000, accrual_exact=accrual_exact)
+        df_schedule = hls.simulate(
+            **params,
+            offset=[(pd.to_datetime("2020-01-01"), 10000)],
+            accrual_exact=accrual_exact,
+        )
+        assert list(df_schedule["Interest"].fillna(0)) == pytest.approx(
+            list(df["Interest"].fillna(0))
+        )
+
+        # deposits and withdrawals apply from their date onwards
+
+        df_schedule = hls.simulate(
+            **params,
+            offset=hls.OffsetSchedule.from_transactions(
+                get_transactions(), balance=10000
+            ),
+            accrual_exact=accrual_exact,
+        )
+        assert df_schedule["Interest"][1] == pytest.approx(
+            (90000 * 10 + 60000 * 5 + 75000 * 13) * 0.06 / 365
+        )
+
+    # the offset only reduces the amount owing down to 0
+
+    df_schedule = hls.simulate(
+        **params, offset=[(start, 0), (pd.to_datetime("2025-02-10"), 200000)]
+    )
+    assert df_schedule["Interest"][1] == pytest.approx(100000 * 0.06 * 10 / 365)
+    assert df_schedule["Interest"][2] == 0
+
+
+def test_simulator_checkpoints():
+    start = pd.to_datetime("2025-03-17")
+    fixed_end = pd.to_datetime("2027-06-03")
+
+    params = dict(
+        loan_start=start,
+        principal=400000,
+        offset=60000,
+        schedule_start=start,
+        interest_rate=[(start, 6.0)],
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=2800,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+        leftover_incoming=fixed_end,
+        leftover_amount=200000,
+        leftover_repayment=1500,
+    )
+
+    df, checkpoints = hls.simulate_with_checkpoints(
+        **params, checkpoint_interval=pd.Timedelta(days=90)
+    )
+    assert df.equals(hls.simulate(**params))
+    assert len(checkpoints) > 10
+
+    # changes from a date onwards only recompute the schedule after the checkpoint before it
+
+    for change_date, change in [
+        (fixed_end, dict(leftover_amount=150000, leftover_repayment=2500)),
+        (
+            pd.to_datetime("2030-02-10"),
+            dict(interest_rate=[(start, 6.0), (pd.to_datetime("2030-02-10"), 7.5)]),
+        ),
+    ]:
+        checkpoint = hls.get_checkpoint(checkpoints, change_date)
+        assert checkpoint.date < change_date
+
+        df = hls.simulate(**params | change)
+        df_resumed = hls.simulate(**params | change, resume_from=checkpoint)
+        assert df_resumed.equals(df)
+
+        summary = hls.simulate_summary(**params | change)
+        summary_resumed = hls.simulate_summary(
+            **params | change, resume_from=checkpoint
+        )
+        assert summary_resumed.end_date == summary.end_date
+        assert summary_resumed.total_interest == pytest.approx(summary.total_interest)
+
+    # the timeline needs to be the same
+
+    with pytest.raises(ValueError):
+        hls.simulate(
+            **params | dict(repayment_cycle=hls.Cycle.MONTHLY_AVERAGE),
+            resume_from=checkpoint,
+        )
+
+
+def test_simulator_iter_schedule():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        principal=500000,
+        offset=20000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=2000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+        extra_win_amount=500,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 10),
+    )
+
+    df = hls.simulate(**params)
+
+    df_rows = pd.DataFrame(list(hls.iter_schedule(**params)))
+    assert list(df_rows.columns) == list(df.columns)
+    assert df_rows.astype(df.dtypes).equals(df)
+
+    chunks = list(hls.iter_schedule(**params, chunk_size=100))
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert pd.concat(chunks).equals(df)
+
+    # stopping early
+
+    for row in hls.iter_schedule(**params):
+        if row.Principal < 400000:
+            break
+    assert row.Date == df[df["Principal"] < 400000]["Date"].iloc[0]
+
+
+def test_simulator_rollups():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=pd.to_datetime("2021-10-31"),
+        principal=500000,
+        offset=20000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=2000,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=False,
+        extra_win_amount=500,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 10),
+    )
+
+    rollups = hls.simulate_rollups(**params, include_schedule=True)
+    df = rollups.schedule
+    assert df.equals(hls.simulate(**params))
+
+    for rollup, period_starts in [
+        (rollups.month, df["Date"].dt.to_period("M").dt.start_time),
+        (
+            rollups.financial_year,
+            pd.to_datetime(
+                (df["Date"].dt.year - (df["Date"].dt.month < 7)).astype(str) + "-07-01"
+            ),
+        ),
+        (
+            rollups.loan_year,
+            pd.to_datetime(
+                (df["Date"].dt.year - (df["Date"].dt.strftime("%m%d") < "1031")).astype(
+                    str
+                )
+                + "-10-31"
+            ),
+        ),
+    ]:
+        groups = df.groupby(period_starts)
+        assert list(rollup["Start"]) == list(groups.groups)
+        for column in ["Interest", "Repayment", "ExtraWinForLoan"]:
+            assert list(rollup[column]) == pytest.approx(list(groups[column].sum()))
+        assert list(rollup["Principal"]) == list(groups["Principal"].last())
+
+    assert rollups.financial_year["Interest"].sum() == pytest.approx(
+        df["Interest"].sum()
+    )
+
+
+def test_simulator_rounding():
+    start = pd.to_datetime("2025-01-31")
+
+    params = dict(
+        loan_start=start,
+        offset=20000,
+        schedule_start=start,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=True,
+        leftover_incoming=pd.to_datetime("2027-01-01"),
+        leftover_repayment=100.01,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 10),
+    )
+
+    scenarios = [
+        dict(
+            principal=500000.004,
+            interest_rate=6.0,
+            repayment=2000.555,
+            leftover_amount=12345.678,
+            extra_win_amount=500,
+        ),
+        dict(
+            principal=400000,
+            interest_rate=5.1,
+            repayment=2500,
+            leftover_amount=None,
+            extra_win_amount=None,
+        ),
+    ]
+
+    # interest is charged in whole cents, as rounded by the bank,
+    # e.g. 400000 * 0.051 * 28 / 365 = 1564.9315...
+
+    for rounding, interest in [("half_even", 1564.93), ("up", 1564.94)]:
+        df = hls.simulate(
+            **scenarios[1]
+            | params
+            | dict(offset=0, repayment_cycle=hls.Cycle.MONTHLY_END_OF_MONTH),
+            rounding=rounding,
+        )
+        assert df["Interest"].dropna().iloc[1] == interest
+
+    # offset schedules are whole cents as well, like single offsets
+
+    offset_schedule = hls.OffsetSchedule([start], [20000.004])
+    assert hls._to_cents(offset_schedule).values == [hls._to_cents(20000.004)]
+    assert hls.simulate(
+        **params | scenarios[1] | dict(offset=[(start, 20000.004)]), rounding="up"
+    ).equals(
+        hls.simulate(
+            **params | scenarios[1] | dict(offset=[(start, 20000)]), rounding="up"
+        )
+    )
+
+    for rounding in hls.cent_roundings:
+        df_batch = hls.simulate_batch(
+            **params,
+            **{key: [scenario[key] for scenario in scenarios] for key in scenarios[0]},
+            rounding=rounding,
+        )
+
+        for i, scenario in enumerate(scenarios):
+            df = hls.simulate(**params, **scenario, rounding=rounding)
+
+            # all amounts are whole cents, the same in batch mode
+
+            cents = df[hls.amount_columns].to_numpy() * 100
+            assert np.nanmax(np.abs(cents - np.rint(cents))) < 1e-6
+
+            df_scenario = df_batch[df_batch["Scenario"] == i].drop(columns="Scenario")
+            assert df_scenario.reset_index(drop=True).equals(df)
+
+    with pytest.raises(ValueError):
+        hls.simulate(**params, **scenarios[0], rounding="half_down")
+
+
+def test_simulator_summary():
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start - pd.Timedelta(days=400),
+        principal=300000,
+        offset=20000,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        repayment=1500,
+        prev_repayment_date=start,
+        repayment_cycle=hls.Cycle.FORTNIGHTLY,
+        repayment_use_stash=True,
+        leftover_incoming=pd.to_datetime("2027-05-01"),
+        leftover_amount=100000,
+        leftover_repayment=1000,
+        extra_win_amount=300,
+        extra_win_cycle=hls.Cycle.MONTHLY_AVERAGE,
+        extra_win_duration=pd.Timedelta(days=365 * 30),
+    )
+
+    df = hls.simulate(**params)
+    summary = hls.simulate_summary(**params)
+
+    assert summary.end_date == df.iloc[-1]["Date"]
+    assert summary.loan_years == df.iloc[-1]["LoanYears"]
+    assert summary.schedule_years == df.iloc[-1]["ScheduleYears"]
+    assert summary.total_interest == pytest.approx(df["Interest"].sum())
+    assert summary.total_repayment == pytest.approx(df["Repayment"].sum())
+    assert summary.total_extra_win_for_loan == pytest.approx(
+        df["ExtraWinForLoan"].sum()
+    )
+    assert summary.total_extra_win_for_us == pytest.approx(df["ExtraWinForUs"].sum())
+    assert summary.principal == df.iloc[-1]["Principal"]
+    assert summary.stash == df.iloc[-1]["Stash"]
+
+
+@pytest.mark.parametrize(
+    "cycle, offset",
+    [
+        (hls.Cycle.FORTNIGHTLY, 0),
+        (hls.Cycle.MONTHLY_1ST_OF_MONTH, 50000),
+    ],
+)
+def test_simulator_solve_repayment(cycle, offset, monkeypatch):
+    start = pd.to_datetime("2025-03-17")
+
+    params = dict(
+        loan_start=start,
+        principal=600000,
+        offset=offset,
+        schedule_start=start,
+        interest_rate=6.0,
+        prev_interest_date=start,
+        interest_cycle=hls.Cycle.MONTHLY_END_OF_MONTH,
+        prev_repayment_date=start,
+        repayment_cycle=cycle,
+        repayment_use_stash=False,
+    )
+
+    evaluations = []
+    simulate_summary = hls.simulate_summary
+    monkeypatch.setattr(
+        hls,
+        "simulate_summary",
+        lambda **kwargs: evaluations.append(kwargs) or simulate_summary(**kwargs),
+    )
+
+    # finish by a given date
+
+    target_end_date = pd.to_datetime("2045-01-01")
+
+    repayment = hls.solve_repayment(**params, target_end_date=target_end_date)
+
+    assert len(evaluations) <= 20
+    assert simulate_summary(**params, repayment=repayment).end_date <= target_end_date
+    assert (
+        simulate_summary(**params, repayment=repayment - 0.01).end_date
+        > target_end_date
+    )
+
+    # stay under a given total interest
+
+    evaluations.clear()
+
+    repayment = hls.solve_repayment(**params, target_total_interest=250000)
+
+    assert len(evaluations) <= 20
+    assert simulate_summary(**params, repayment=repayment).total_interest <= 250000
+    assert (
+        simulate_summary(**params, repayment=repayment - 0.01).total_interest > 250000
+    )